@@ -1,13 +1,25 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Dict, Optional, Any
-from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, TypeAdapter
+from typing import List, Dict, NamedTuple, Optional, Any, Tuple
+from functools import lru_cache, partial
+from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import numpy as np
+import orjson
+try:
+    from numba import njit
+except ImportError:  # optional; answer scoring falls back to the NumPy kernel
+    njit = None
+import asyncio
+import json
 import logging
 import os
-import json
 import traceback
 import re
+import secrets
 
 # unify with env vars so Docker-compose can override
 DB_PERSIST_DIR = os.getenv("DB_PERSIST_DIR", "vectordb")
@@ -15,10 +27,14 @@ PDF_DATA_DIR   = os.getenv("PDF_DATA_DIR",   "data/")
 
 
 # --- RAG/vector/LLM imports and initialization ---
-from rag_pipeline.loader import load_documents, chunk_documents
-from rag_pipeline.embedder import get_embedder
-from rag_pipeline.store import store_embeddings, load_existing_embeddings
-from rag_pipeline.retriever import build_rag_chain
+from rag_pipeline.loader import iter_documents, chunk_documents
+from rag_pipeline.embedder import embedder_id, get_embedder
+from rag_pipeline.store import store_embeddings, load_existing_embeddings, vector_store_exists, prefetch_store, get_chroma_client
+from rag_pipeline.retriever import agenerate_answers, load_llm, load_llm_tokenizer
+from rag_pipeline.cache import SemanticCache
+from rag_pipeline.batching import MicroBatcher
+from rag_pipeline.index import VectorIndex
+from session_store import create_session_store
 
 # ------------------------------------
 # Logging Configuration
@@ -29,7 +45,16 @@ logger = logging.getLogger(__name__)
 # ------------------------------------
 # FastAPI Initialization
 # ------------------------------------
-app = FastAPI(title="RiskIQ-AI")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The RAG pipeline loads here rather than at import, so importing this module stays cheap
+    await startup_event()
+    try:
+        yield
+    finally:
+        await shutdown_event()
+
+app = FastAPI(title="RiskIQ-AI", default_response_class=ORJSONResponse, lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -37,54 +62,193 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let browser clients read the session token issued by /initialize-assessment
+    expose_headers=["X-Session-ID"],
 )
 
 # ------------------------------------
 # Global RAG Pipeline Components & Limits
 # ------------------------------------
-DB_PERSIST_DIR = "vectordb"
-PDF_DATA_DIR = "data/"
 MAX_RAG_CONTEXT_CHARS = 1000
-TARGET_LLM_PROMPT_TOTAL_CHARS = 3600
+# Advice prompt budget in LLM tokens (about what the earlier 3600-character target came to)
+TARGET_LLM_PROMPT_TOTAL_TOKENS = int(os.getenv("TARGET_LLM_PROMPT_TOTAL_TOKENS", "900"))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "900"))
+SEMANTIC_CACHE_DISTANCE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_DISTANCE_THRESHOLD", "0.12"))
+# Kept apart from DB_PERSIST_DIR, whose emptiness decides whether the vector store is rebuilt
+SEMANTIC_CACHE_DIR = os.getenv("SEMANTIC_CACHE_DIR", "cache")
+SEMANTIC_CACHE_FLUSH_SECONDS = float(os.getenv("SEMANTIC_CACHE_FLUSH_SECONDS", "60"))
+# "int8" stores the exact-search embedding matrix quantized (4x smaller); default float32
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float32")
+# Constrain LLM decoding to LLM_ADVICE_JSON_SCHEMA so the advice is always parseable JSON
+LLM_GUIDED_JSON = os.getenv("LLM_GUIDED_JSON", "1") == "1"
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "8"))
+MAX_BATCH_WAIT_MS = float(os.getenv("MAX_BATCH_WAIT_MS", "20"))
+# LLM batches generated at the same time; set 1 if two batches of prompts do not fit in GPU memory
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "2"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_BATCH_WAIT_MS = float(os.getenv("EMBED_BATCH_WAIT_MS", "5"))
+# Threads for embedding and vector store calls, kept apart from the default executor so a burst
+# of retrieval work can't starve other to_thread users (and vice versa)
+RAG_WORKERS = int(os.getenv("RAG_WORKERS", "4"))
+# Recent embeddings memoized by exact text, so a resubmitted answer set skips the model
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "1024"))
+REDIS_URL = os.getenv("REDIS_URL")
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "1800"))
+SESSION_HEADER = "X-Session-ID"
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+# Stop intermediaries (nginx in particular) from caching or buffering the event stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
 
 embedder = None
 db = None
-qa_chain = None
+vector_index = None
+llm = None
+prompt_tokenizer = None
+rag_executor = ThreadPoolExecutor(max_workers=RAG_WORKERS, thread_name_prefix="rag")
+llm_cache = None
+llm_batcher = None
+embed_batcher = None
+llm_cache_flusher = None
 
-@app.on_event("startup")
 async def startup_event():
-    global embedder, db, qa_chain
+    global embedder, db, vector_index, llm, prompt_tokenizer, llm_cache, llm_batcher, embed_batcher, llm_cache_flusher
     try:
-        logger.info("Initializing embedder...")
-        embedder = get_embedder()
-        if not embedder:
-            raise RuntimeError("Failed to initialize embedder")
-
-        logger.info("Initializing RAG pipeline...")
-        if os.path.exists(DB_PERSIST_DIR) and os.listdir(DB_PERSIST_DIR):
-            db = load_existing_embeddings(embedder, persist_dir=DB_PERSIST_DIR)
-        else:
-            docs = load_documents(PDF_DATA_DIR)
-            if not docs:
-                raise RuntimeError(f"No documents found in {PDF_DATA_DIR}")
-            chunks = chunk_documents(docs)
-            db = store_embeddings(chunks, embedder, persist_dir=DB_PERSIST_DIR)
+        # Start paging the persisted store in while the models load
+        prefetched = prefetch_store(DB_PERSIST_DIR)
+        if prefetched:
+            logger.info(f"Prefetching {prefetched} bytes of {DB_PERSIST_DIR}")
+
+        # The LLM doesn't depend on the store, so load it in the background while the embedder
+        # and the store come up; it is usually the slowest step
+        logger.info("Loading LLM...")
+        llm_task = asyncio.ensure_future(asyncio.to_thread(load_llm, LLM_ADVICE_JSON_SCHEMA if LLM_GUIDED_JSON else None))
+        try:
+            logger.info("Initializing embedder...")
+            rebuild = not vector_store_exists(DB_PERSIST_DIR)
+            if rebuild:
+                # Parsing the PDFs doesn't need the embedder either; the pool starts on them now
+                # and the store below chunks and embeds each file as soon as it is parsed
+                embedder, docs = await asyncio.gather(asyncio.to_thread(get_embedder), asyncio.to_thread(iter_documents, PDF_DATA_DIR))
+            else:
+                embedder = await asyncio.to_thread(get_embedder)
+            if not embedder:
+                raise RuntimeError("Failed to initialize embedder")
+
+            logger.info("Initializing RAG pipeline...")
+            if not rebuild:
+                db = await asyncio.to_thread(load_existing_embeddings, embedder, persist_dir=DB_PERSIST_DIR)
+            else:
+                chunks = chunk_documents(docs)
+                # Check for an empty corpus before anything is written to DB_PERSIST_DIR; a
+                # store left there would make every later start skip the rebuild
+                first = await asyncio.to_thread(next, chunks, None)
+                if first is None:
+                    raise RuntimeError(f"No documents found in {PDF_DATA_DIR}")
+                db = await asyncio.to_thread(store_embeddings, chain([first], chunks), embedder, persist_dir=DB_PERSIST_DIR)
+
+            if not db:
+                raise RuntimeError("Failed to initialize vector store")
+
+            logger.info("Building in-memory vector index...")
+            # With a Chroma server the collection doesn't live in DB_PERSIST_DIR (which may not even
+            # exist here), so the HNSW graph is only persisted next to an embedded store
+            index_dir = None if get_chroma_client() else DB_PERSIST_DIR
+            vector_index = await asyncio.to_thread(
+                VectorIndex.from_chroma, db, persist_dir=index_dir, quantize=VECTOR_INDEX_DTYPE == "int8", embedder_id=embedder_id(),
+            )
 
-        if not db:
-            raise RuntimeError("Failed to initialize vector store")
+            llm = await llm_task
+        except BaseException:
+            # Stop waiting on the LLM if an earlier step failed; the error below is the one to report
+            llm_task.cancel()
+            raise
 
-        qa_chain = build_rag_chain(db)
-        if not qa_chain:
-            raise RuntimeError("Failed to build QA chain")
+        prompt_tokenizer = load_llm_tokenizer()
+
+        llm_cache = SemanticCache(
+            embedder,
+            ttl_seconds=SEMANTIC_CACHE_TTL_SECONDS,
+            distance_threshold=SEMANTIC_CACHE_DISTANCE_THRESHOLD,
+            embed_async=embed_async,
+        )
+        if rebuild:
+            # Cached advice was drawn from the previous knowledge base; the next save drops it
+            llm_cache.clear()
+        else:
+            llm_cache.load(SEMANTIC_CACHE_DIR)
+        llm_cache_flusher = asyncio.get_running_loop().create_task(flush_llm_cache_periodically())
+        llm_batcher = MicroBatcher(
+            invoke_llm_batch,
+            max_batch_size=MAX_BATCH_SIZE,
+            max_wait_ms=MAX_BATCH_WAIT_MS,
+            name="llm_batcher",
+            max_concurrency=LLM_MAX_CONCURRENCY,
+        )
+        llm_batcher.start()
+        embed_batcher = MicroBatcher(
+            embed_texts_batch,
+            max_batch_size=EMBED_BATCH_SIZE,
+            max_wait_ms=EMBED_BATCH_WAIT_MS,
+            name="embed_batcher",
+        )
+        embed_batcher.start()
+        # The first forward pass pays for lazy weight loading and kernel selection; take
+        # that hit here rather than on the first request
+        await embed_async("warmup")
 
         logger.info("RAG pipeline initialized successfully")
     except Exception as e:
         logger.error(f"Failed to initialize RAG pipeline: {str(e)}")
         raise RuntimeError(f"Startup error: {str(e)}")
 
+async def flush_llm_cache_periodically():
+    """Persist new semantic cache entries every SEMANTIC_CACHE_FLUSH_SECONDS."""
+    while True:
+        await asyncio.sleep(SEMANTIC_CACHE_FLUSH_SECONDS)
+        try:
+            await asyncio.to_thread(llm_cache.save, SEMANTIC_CACHE_DIR)
+        except Exception as e:
+            logger.warning(f"Failed to persist semantic cache: {e}")
+
+async def shutdown_event():
+    if llm_cache_flusher:
+        llm_cache_flusher.cancel()
+    if llm_cache:
+        logger.info(f"Semantic cache: {llm_cache.hits} hits, {llm_cache.misses} misses")
+        llm_cache.save(SEMANTIC_CACHE_DIR)
+    if llm_batcher:
+        await llm_batcher.stop()
+    if embed_batcher:
+        await embed_batcher.stop()
+    rag_executor.shutdown(wait=False, cancel_futures=True)
+    await session_store.close()
+
+async def run_rag_blocking(fn, *args, **kwargs):
+    """Run a blocking embedding or vector store call on the bounded RAG executor."""
+    return await asyncio.get_running_loop().run_in_executor(rag_executor, partial(fn, *args, **kwargs))
+
+async def embed_texts_batch(texts: List[str]) -> List[List[float]]:
+    """Embed a batch of texts with one model call, off the event loop."""
+    return await run_rag_blocking(embedder.embed_documents, texts)
+
+_embedding_cache: Dict[str, List[float]] = {}
+
+async def embed_async(text: str) -> List[float]:
+    """
+    Embed `text`, sharing a model call with other requests embedding at the same time.
+    The last EMBED_CACHE_SIZE distinct texts are served from memory.
+    """
+    embedding = _embedding_cache.pop(text, None)
+    if embedding is None:
+        embedding = await embed_batcher.submit(text)
+        while len(_embedding_cache) >= EMBED_CACHE_SIZE:
+            del _embedding_cache[next(iter(_embedding_cache))]
+    _embedding_cache[text] = embedding
+    return embedding
+
 @app.get("/healthz")
 def health_check():
-    if qa_chain:
+    if llm:
         return {"status": "ok"}
     else:
         raise HTTPException(status_code=503, detail="RAG not ready")
@@ -112,6 +276,8 @@ class RiskQuestion(BaseModel):
     helper_text: Optional[str] = None
     scoring_focus: str
 
+QUESTIONS_ADAPTER = TypeAdapter(List[RiskQuestion])
+
 class RiskTableRow(BaseModel):
     id: str
     category: str
@@ -122,6 +288,15 @@ class RiskTableRow(BaseModel):
     weight: float
     explanation: str
 
+# Serializes a list of rows in one pydantic-core call, without building intermediate dicts
+RISK_TABLE_ADAPTER = TypeAdapter(List[RiskTableRow])
+
+class RiskAdvice(BaseModel):
+    """The LLM half of RiskAssessmentResult, which /submit-answers/stream sends as its own event."""
+    recommendations: List[str]
+    resources: List[Dict[str, str]]
+    raw_llm_output: Optional[str] = None
+
 class RiskAssessmentResult(BaseModel):
     overall_weighted_score: float
     risk_table: List[RiskTableRow]
@@ -130,10 +305,50 @@ class RiskAssessmentResult(BaseModel):
     data_insights: List[str]
     raw_llm_output: Optional[str] = None
 
-session_context: Dict[str, Any] = {}
+# Shape of the JSON object the LLM is asked for (and constrained to) in generate_llm_advice_async
+LLM_ADVICE_JSON_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "recommendations": {"type": "array", "items": {"type": "string"}},
+        "resources": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"title": {"type": "string"}, "url": {"type": "string"}},
+                "required": ["title", "url"],
+            },
+        },
+        "rawLLMOutput": {"type": "string"},
+    },
+    "required": ["recommendations", "resources", "rawLLMOutput"],
+}
+
+# Returned when the LLM gives no recommendations or resources. Shared by every response and
+# never mutated; the resources stay plain dicts because orjson can't serialize a mappingproxy
+DEFAULT_RECOMMENDATIONS: Tuple[str, ...] = (
+    "Implement a formal risk assessment process for emerging technology adoption.",
+    "Develop a comprehensive security framework aligned with industry standards.",
+    "Establish clear governance procedures for technology evaluation and implementation.",
+)
+DEFAULT_RESOURCES: Tuple[Dict[str, str], ...] = (
+    {"title": "NIST Cybersecurity Framework", "url": "https://www.nist.gov/cyberframework"},
+    {"title": "ISO/IEC 27001 Information Security Management", "url": "https://www.iso.org/isoiec-27001-information-security.html"},
+)
+
+# Backed by Redis when REDIS_URL is set, so any uvicorn worker can serve any step of a session
+session_store = create_session_store(REDIS_URL, ttl_seconds=SESSION_TTL_SECONDS)
+
+class RiskCategory(NamedTuple):
+    id: str
+    category: str
+    definition: str
+    scoring_focus: str
+    weight: float
+    max_score: int
 
-# Comprehensive risk categories definition with business focus
-RISK_CATEGORIES_DEFINITION = [
+# Comprehensive risk categories definition with business focus; immutable, so the derived
+# lookup tables below can't drift from it at runtime
+RISK_CATEGORIES_DEFINITION: Tuple[RiskCategory, ...] = tuple(RiskCategory(**c) for c in [
     {"id": "business_strategy", "category": "Business Strategy Alignment", "definition": "How well emerging technology initiatives align with overall business goals and strategy.", "scoring_focus": "Strategic alignment, ROI measurement, business case development", "weight": 0.06, "max_score": 10},
     {"id": "market_position", "category": "Market Position & Competitive Advantage", "definition": "How emerging technologies affect market position and create competitive advantages.", "scoring_focus": "Market differentiation, first-mover advantage, competitive analysis", "weight": 0.05, "max_score": 10},
     {"id": "financial_impact", "category": "Financial Impact & Investment", "definition": "Financial considerations for emerging technology adoption including budgeting and ROI.", "scoring_focus": "Budget allocation, cost management, ROI forecasting", "weight": 0.05, "max_score": 10},
@@ -156,58 +371,230 @@ RISK_CATEGORIES_DEFINITION = [
     {"id": "emerging_tech_adoption", "category": "Emerging Technology Adoption", "definition": "Preparedness to adopt and govern new technologies (AI, quantum, blockchain) securely.", "scoring_focus": "Risk vetting, PoC governance, PQC, AI use policy", "weight": 0.03, "max_score": 10},
     {"id": "innovation_culture", "category": "Innovation Culture", "definition": "Company's ability to foster innovation and experimentation with emerging technologies.", "scoring_focus": "Innovation programs, idea management, experimentation frameworks", "weight": 0.04, "max_score": 10},
     {"id": "talent_management", "category": "Talent Management", "definition": "Strategies for attracting, developing, and retaining talent for emerging technology initiatives.", "scoring_focus": "Skills development, recruitment strategy, retention programs", "weight": 0.05, "max_score": 10}
-]
+])
+
+# Struct-of-arrays view of RISK_CATEGORIES_DEFINITION, built once so request handlers index
+# parallel tuples instead of re-reading the definitions and re-formatting the same strings
+(
+    _CATEGORY_IDS,
+    _CATEGORY_NAMES,
+    _CATEGORY_DEFINITIONS,
+    _CATEGORY_SCORING_FOCUS,
+    _CATEGORY_WEIGHT_VALUES,
+    _CATEGORY_MAX_SCORES,
+) = zip(*RISK_CATEGORIES_DEFINITION)
+_CATEGORY_MAX_SCORE_ARRAY = np.array(_CATEGORY_MAX_SCORES, dtype=np.int64)
+_CATEGORY_WEIGHTS = np.array(_CATEGORY_WEIGHT_VALUES, dtype=np.float64)
+# Shared by every request, so make accidental in-place edits fail loudly
+_CATEGORY_MAX_SCORE_ARRAY.flags.writeable = False
+_CATEGORY_WEIGHTS.flags.writeable = False
+_CATEGORY_WEIGHT_TOTAL = sum(_CATEGORY_WEIGHT_VALUES)
+_CATEGORY_INDEX = {cat_id: i for i, cat_id in enumerate(_CATEGORY_IDS)}
+
+# Profile-independent question text; emerging_tech_adoption only has the prefix before its tech list
+_QUESTION_TEMPLATES = tuple(
+    f"Regarding {c.category.lower()} ({c.definition}), how would you describe your current practices related to {c.scoring_focus.lower()}?"
+    for c in RISK_CATEGORIES_DEFINITION
+)
+_HELPER_TEMPLATES = tuple(
+    f"Consider: {c.definition}. Focus on aspects like: {c.scoring_focus}."
+    for c in RISK_CATEGORIES_DEFINITION
+)
+_CLOUD_IDX = _CATEGORY_INDEX["cloud_security"]
+_CLOUD_QUESTION_NOT_ADOPTED = (
+    f"Regarding {_CATEGORY_NAMES[_CLOUD_IDX].lower()} ({_CATEGORY_DEFINITIONS[_CLOUD_IDX]}), even if not a primary focus, "
+    f"what are your considerations or practices for {_CATEGORY_SCORING_FOCUS[_CLOUD_IDX].lower()} when evaluating or using any cloud services?"
+)
+_EMERGING_TECH_IDX = _CATEGORY_INDEX["emerging_tech_adoption"]
+_EMERGING_TECH_QUESTION_PREFIX = (
+    f"Regarding {_CATEGORY_NAMES[_EMERGING_TECH_IDX].lower()}, how do you evaluate and govern the adoption of new technologies like "
+)
+_EXPLANATION_SUFFIXES = tuple(f"Assessment focused on {c.scoring_focus}." for c in RISK_CATEGORIES_DEFINITION)
+# Leading part of each data insight line, up to the score
+_INSIGHT_PREFIXES = tuple(f"{c.category} (Weight: {c.weight*100}%): Score " for c in RISK_CATEGORIES_DEFINITION)
+
+# Categories whose questions are flagged as a priority area for every company
+ALWAYS_PRIORITIZED_CATEGORIES = ("business_strategy",)
+
+# (profile field, lower-cased values that trigger the rule, categories prioritized on a match)
+QUESTION_PRIORITY_RULES = (
+    # Financial impact for smaller companies
+    ("size", frozenset({"startup", "small", "sme", "medium"}), ("financial_impact", "talent_management")),
+    # Market position for larger companies
+    ("size", frozenset({"large", "enterprise", "corporation"}), ("market_position", "regulatory_compliance")),
+    # Innovation for early adopters
+    ("tech_adoption", frozenset({"early adopter", "innovator", "leader"}), ("innovation_culture", "emerging_tech_adoption")),
+    # Security for regulated industries
+    ("industry", frozenset({"finance", "banking", "healthcare", "government", "insurance"}), ("data_sensitivity", "regulatory_compliance", "third_party_risk")),
+)
+
+# Keywords that nudge a category score up or down; positive matches take precedence.
+# Each list is compiled once into a case-insensitive alternation so an answer is scanned in a
+# single pass without first building a lower-cased copy.
+POSITIVE_KEYWORDS = ["strong", "comprehensive", "fully implemented", "excellent", "robust",
+                     "mature", "advanced", "complete", "thorough", "effective"]
+NEGATIVE_KEYWORDS = ["weak", "lacking", "not implemented", "poor", "minimal",
+                     "immature", "basic", "incomplete", "inadequate", "ineffective"]
+POSITIVE_KEYWORDS_RE = re.compile("|".join(map(re.escape, POSITIVE_KEYWORDS)), re.IGNORECASE)
+NEGATIVE_KEYWORDS_RE = re.compile("|".join(map(re.escape, NEGATIVE_KEYWORDS)), re.IGNORECASE)
+NO_ANSWER_RE = re.compile("no answer provided", re.IGNORECASE)
+
+# Base score by answer length: under 20 chars scores 4, under 100 scores 6, anything longer 8;
+# a missing answer scores NO_ANSWER_SCORE
+ANSWER_LENGTH_BOUNDS = np.array([20, 100], dtype=np.int64)
+ANSWER_LENGTH_SCORES = np.array([4, 6, 8], dtype=np.int64)
+NO_ANSWER_SCORE = 2
+
+def _score_answers_numpy(lengths, unanswered, positive, negative, max_scores, weights, length_bounds, length_scores, no_answer_score):
+    """
+    Score every category from its answer features and return `(scores, weighted_sum)`.
+    Keyword flags adjust the length-based score by +/-2 before clamping to [0, max_score].
+    """
+    scores = np.where(unanswered, no_answer_score, length_scores[np.searchsorted(length_bounds, lengths, side="right")])
+    scores = np.clip(scores + 2 * positive - 2 * negative, 0, max_scores)
+    return scores, float(np.dot(scores, weights))
+
+def _score_answers_loop(lengths, unanswered, positive, negative, max_scores, weights, length_bounds, length_scores, no_answer_score):
+    """Same as _score_answers_numpy, written as a plain loop for numba to compile."""
+    count = lengths.shape[0]
+    scores = np.empty(count, dtype=np.int64)
+    weighted_sum = 0.0
+    for i in range(count):
+        if unanswered[i]:
+            score = no_answer_score
+        else:
+            bucket = 0
+            while bucket < length_bounds.shape[0] and lengths[i] >= length_bounds[bucket]:
+                bucket += 1
+            score = length_scores[bucket]
+        score += 2 * positive[i] - 2 * negative[i]
+        score = min(max(score, 0), max_scores[i])
+        scores[i] = score
+        weighted_sum += score * weights[i]
+    return scores, weighted_sum
+
+# fastmath is left off: reassociating the weighted sum could change the rounded overall score
+score_answers = njit(cache=True)(_score_answers_loop) if njit is not None else _score_answers_numpy
 
 @app.post("/initialize-assessment")
-def initialize_assessment(profile: CompanyProfile):
-    if not qa_chain:
+async def initialize_assessment(profile: CompanyProfile, session_id: Optional[str] = Header(None, alias=SESSION_HEADER)):
+    if not llm:
         logger.error("RAG pipeline not initialized")
         raise HTTPException(status_code=503, detail="Service not ready. Please try again in a few moments.")
 
     logger.info(f"Received company profile: {profile.name if profile.name else 'Unnamed Company'}")
-    session_context["profile"] = profile
+    # Issue a fresh session token unless the client is re-initializing a live session this
+    # server issued; an unknown id is never adopted, so clients can't plant their own
+    if not session_id or await session_store.get(session_id, "profile") is None:
+        session_id = secrets.token_urlsafe(16)
+    # The profile half of the retrieval query is fixed for the session, so embed it once here,
+    # overlapping the embedding with the profile write
+    profile_embedding, _ = await asyncio.gather(
+        embed_async(build_profile_query(profile)),
+        session_store.set(session_id, "profile", profile.model_dump_json()),
+    )
+    await session_store.set(session_id, "profile_embedding", orjson.dumps(profile_embedding).decode())
     try:
-        questions = generate_dynamic_questions(profile)
-        if not questions:
+        questions_json = encoded_dynamic_questions(
+            profile.industry,
+            prioritized_categories_for(profile),
+            tuple(profile.emerging_technologies),
+        )
+        if not questions_json:
             raise HTTPException(status_code=500, detail="Failed to generate assessment questions")
-        return jsonable_encoder(questions)
+        return Response(content=questions_json, media_type="application/json", headers={SESSION_HEADER: session_id})
     except Exception as e:
         logger.error(f"Error generating questions: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to initialize assessment: {str(e)}")
 
+async def load_session_profile(session_id: Optional[str]) -> CompanyProfile:
+    """Return the session's company profile, or raise a 400 if the assessment wasn't initialized."""
+    if not session_id:
+        raise HTTPException(status_code=400, detail=f"Missing {SESSION_HEADER} header. Send the token returned by /initialize-assessment.")
+    raw_profile = await session_store.get(session_id, "profile")
+    if not raw_profile:
+        logger.error("No company profile found in session for submitting answers.")
+        raise HTTPException(status_code=400, detail="No company profile found. Please initialize assessment first.")
+    return CompanyProfile.model_validate_json(raw_profile)
+
+async def load_session_profile_embedding(session_id: str) -> Optional[np.ndarray]:
+    raw_profile_embedding = await session_store.get(session_id, "profile_embedding")
+    return np.asarray(orjson.loads(raw_profile_embedding), dtype=np.float32) if raw_profile_embedding else None
+
+def format_sse(event: str, data: Any) -> bytes:
+    """Encode one Server-Sent Event with a JSON payload."""
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+@app.post("/submit-answers/stream")
+async def submit_answers_stream(request: RiskAnswersRequest, session_id: Optional[str] = Header(None, alias=SESSION_HEADER)):
+    """
+    Same assessment as /submit-answers, streamed as Server-Sent Events so the client can render
+    the scores before the LLM finishes: an `assessment` event (overall_weighted_score,
+    risk_table, data_insights), then an `advice` event (recommendations, resources,
+    raw_llm_output), or an `error` event if scoring or advice generation fails. Comment lines
+    are sent every SSE_HEARTBEAT_SECONDS in between.
+    """
+    if not llm:
+        logger.error("RAG pipeline not initialized")
+        raise HTTPException(status_code=503, detail="Service not ready. Please try again in a few moments.")
+
+    profile = await load_session_profile(session_id)
+    answers_dict = {ans.question_id: ans.answer for ans in request.answers}
+
+    async def events():
+        advice = None
+        try:
+            (risk_table, overall_weighted_score, data_insights), profile_embedding = await asyncio.gather(
+                asyncio.to_thread(build_risk_table, profile, answers_dict),
+                load_session_profile_embedding(session_id),
+            )
+            yield format_sse("assessment", {
+                "overall_weighted_score": overall_weighted_score,
+                "risk_table": orjson.Fragment(RISK_TABLE_ADAPTER.dump_json(risk_table)),
+                "data_insights": data_insights,
+            })
+            advice = asyncio.ensure_future(generate_llm_advice_async(profile, answers_dict, risk_table, profile_embedding))
+            # Comment lines keep proxies and clients from timing out an idle stream while the LLM runs
+            while not (await asyncio.wait({advice}, timeout=SSE_HEARTBEAT_SECONDS))[0]:
+                yield b": keep-alive\n\n"
+            recommendations, resources, raw_llm = advice.result()
+            # Validated like the same fields of /submit-answers' RiskAssessmentResult
+            result = RiskAdvice(recommendations=recommendations, resources=resources, raw_llm_output=raw_llm)
+            yield format_sse("advice", orjson.Fragment(result.model_dump_json()))
+        except Exception as e:
+            logger.error(f"Error streaming assessment: {traceback.format_exc()}")
+            yield format_sse("error", {"detail": f"Failed to process assessment: {str(e)}"})
+        finally:
+            # The client went away mid-stream; don't keep generating advice nobody will read
+            if advice:
+                advice.cancel()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @app.post("/submit-answers", response_model=RiskAssessmentResult)
-async def submit_answers(request: RiskAnswersRequest):
-    if not qa_chain:
+async def submit_answers(request: RiskAnswersRequest, session_id: Optional[str] = Header(None, alias=SESSION_HEADER)):
+    if not llm:
         logger.error("RAG pipeline not initialized")
         raise HTTPException(status_code=503, detail="Service not ready. Please try again in a few moments.")
 
-    profile = session_context.get("profile")
-    if not profile:
-        logger.error("No company profile found in session for submitting answers.")
-        raise HTTPException(status_code=400, detail="No company profile found. Please initialize assessment first.")
+    profile = await load_session_profile(session_id)
 
     try:
         logger.info(f"Received {len(request.answers)} answers for profile: {profile.name if profile.name else 'Unnamed Company'}")
-        logger.info(f"Answer types: {[type(ans) for ans in request.answers]}")
-        
-        # Create a dictionary mapping question IDs to answers
-        answers_dict = {}
-        for ans in request.answers:
-            logger.info(f"Processing answer: {ans}")
-            answers_dict[ans.question_id] = ans.answer
-        
-        logger.info(f"Processed {len(answers_dict)} answers into dictionary")
+        answers_dict = {ans.question_id: ans.answer for ans in request.answers}
         
-        risk_table, overall_weighted_score, data_insights = build_risk_table(profile, answers_dict)
+        # The session read for the profile embedding overlaps scoring; retrieval itself has to
+        # wait, since its query and the advice cache key are built from the scored table
+        (risk_table, overall_weighted_score, data_insights), profile_embedding = await asyncio.gather(
+            asyncio.to_thread(build_risk_table, profile, answers_dict),
+            load_session_profile_embedding(session_id),
+        )
         logger.info(f"Built risk table with {len(risk_table)} rows, overall score: {overall_weighted_score}")
         
-        context = await retrieve_rag_context(profile, answers_dict, risk_table)
-        logger.info(f"Retrieved RAG context of length: {len(context)}")
-        
-        recommendations, resources, raw_llm = await generate_llm_advice_async(profile, answers_dict, risk_table, context)
+        recommendations, resources, raw_llm = await generate_llm_advice_async(profile, answers_dict, risk_table, profile_embedding)
         logger.info(f"Generated {len(recommendations)} recommendations and {len(resources)} resources")
 
-        return RiskAssessmentResult(
+        result = RiskAssessmentResult(
             overall_weighted_score=overall_weighted_score,
             risk_table=risk_table,
             recommendations=recommendations,
@@ -215,310 +602,426 @@ async def submit_answers(request: RiskAnswersRequest):
             data_insights=data_insights,
             raw_llm_output=raw_llm
         )
+        # Serialize once in pydantic-core; returning the model would make FastAPI re-validate
+        # it against response_model (kept for the OpenAPI schema) and encode it a second time
+        return Response(content=result.model_dump_json(), media_type="application/json")
     except Exception as e:
         logger.error(f"Error processing answers: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"Failed to process assessment: {str(e)}")
 
+def prioritized_categories_for(profile: CompanyProfile) -> frozenset:
+    """Categories to flag as a priority area, based on the company profile."""
+    prioritized_categories = set(ALWAYS_PRIORITIZED_CATEGORIES)
+    for field, values, category_ids in QUESTION_PRIORITY_RULES:
+        if getattr(profile, field).lower() in values:
+            prioritized_categories.update(category_ids)
+    return frozenset(prioritized_categories)
+
 def generate_dynamic_questions(profile: CompanyProfile) -> List[RiskQuestion]:
     """Generate a comprehensive set of risk assessment questions based on the company profile."""
+    return build_questions(profile.industry, prioritized_categories_for(profile), tuple(profile.emerging_technologies))
+
+def build_questions(industry: str, prioritized_categories: frozenset, emerging_technologies: Tuple[str, ...]) -> List[RiskQuestion]:
+    """
+    The question set for a profile, reduced to the only things that vary it: the industry named
+    in the priority note, the prioritized categories and the emerging technologies.
+    """
     questions = []
-    
-    # Determine which categories to prioritize based on company profile
-    prioritized_categories = []
-    
-    # Prioritize business strategy for all companies
-    prioritized_categories.append("business_strategy")
-    
-    # Prioritize financial impact for smaller companies
-    if profile.size.lower() in ["startup", "small", "sme", "medium"]:
-        prioritized_categories.extend(["financial_impact", "talent_management"])
-    
-    # Prioritize market position for larger companies
-    if profile.size.lower() in ["large", "enterprise", "corporation"]:
-        prioritized_categories.extend(["market_position", "regulatory_compliance"])
-    
-    # Prioritize innovation for early adopters
-    if profile.tech_adoption.lower() in ["early adopter", "innovator", "leader"]:
-        prioritized_categories.extend(["innovation_culture", "emerging_tech_adoption"])
-    
-    # Prioritize security for regulated industries
-    if profile.industry.lower() in ["finance", "banking", "healthcare", "government", "insurance"]:
-        prioritized_categories.extend(["data_sensitivity", "regulatory_compliance", "third_party_risk"])
+    priority_note = f" This is a priority area for {industry} companies of your size and technology adoption level."
+    uses_cloud = any("cloud" in tech.lower() for tech in emerging_technologies)
     
     # Add questions for all categories, prioritizing the selected ones
-    for cat_def in RISK_CATEGORIES_DEFINITION:
-        # Customize question based on category and profile
-        question_text = f"Regarding {cat_def['category'].lower()} ({cat_def['definition']}), how would you describe your current practices related to {cat_def['scoring_focus'].lower()}?"
+    for i, cat_id in enumerate(_CATEGORY_IDS):
+        question_text = _QUESTION_TEMPLATES[i]
         
         # Customize helper text based on whether this is a priority category
-        helper_text = f"Consider: {cat_def['definition']}. Focus on aspects like: {cat_def['scoring_focus']}."
-        if cat_def['id'] in prioritized_categories:
-            helper_text += f" This is a priority area for {profile.industry} companies of your size and technology adoption level."
+        helper_text = _HELPER_TEMPLATES[i]
+        if cat_id in prioritized_categories:
+            helper_text += priority_note
         
         # Add specific customizations for certain categories
-        if cat_def['id'] == "cloud_security" and "cloud" not in profile.emerging_technologies and not any("cloud" in tech.lower() for tech in profile.emerging_technologies):
-            question_text = f"Regarding {cat_def['category'].lower()} ({cat_def['definition']}), even if not a primary focus, what are your considerations or practices for {cat_def['scoring_focus'].lower()} when evaluating or using any cloud services?"
+        if i == _CLOUD_IDX and not uses_cloud:
+            question_text = _CLOUD_QUESTION_NOT_ADOPTED
+        elif i == _EMERGING_TECH_IDX:
+            question_text = f"{_EMERGING_TECH_QUESTION_PREFIX}{', '.join(emerging_technologies)} in your organization?"
         
-        if cat_def['id'] == "emerging_tech_adoption":
-            tech_list = ", ".join(profile.emerging_technologies)
-            question_text = f"Regarding {cat_def['category'].lower()}, how do you evaluate and govern the adoption of new technologies like {tech_list} in your organization?"
-        
-        questions.append(RiskQuestion(
-            id=cat_def['id'],
+        questions.append(RiskQuestion.model_construct(
+            id=cat_id,
             question_text=question_text,
-            category_name=cat_def['category'],
+            category_name=_CATEGORY_NAMES[i],
             helper_text=helper_text,
-            scoring_focus=cat_def['scoring_focus']
+            scoring_focus=_CATEGORY_SCORING_FOCUS[i]
         ))
     
     logger.info(f"Generated {len(questions)} dynamic questions with {len(prioritized_categories)} prioritized categories")
     return questions
 
+@lru_cache(maxsize=256)
+def encoded_dynamic_questions(industry: str, prioritized_categories: frozenset, emerging_technologies: Tuple[str, ...]) -> bytes:
+    """
+    JSON-encoded output of build_questions. Keying on the prioritized categories rather than
+    the raw size and tech adoption strings lets every profile that triggers the same rules
+    share an entry. Returns empty bytes if no questions were generated.
+    """
+    questions = build_questions(industry, prioritized_categories, emerging_technologies)
+    if not questions:
+        return b""
+    return QUESTIONS_ADAPTER.dump_json(questions)
+
 def build_risk_table(profile: CompanyProfile, answers: Dict[str, str]) -> tuple[List[RiskTableRow], float, List[str]]:
     """Build a risk assessment table based on the company profile and answers."""
     table = []
-    total_weighted_score_sum = 0.0
-    total_weight_sum = 0.0
     data_insights = []
+    count = len(_CATEGORY_IDS)
+    answer_texts = [answers.get(cat_id, "No answer provided") for cat_id in _CATEGORY_IDS]
     
-    for cat_def in RISK_CATEGORIES_DEFINITION:
-        answer_text = answers.get(cat_def['id'], "No answer provided")
-        
-        # Basic scoring logic based on answer length and keywords
-        score = 0
-        if answer_text.lower() == "no answer provided":
-            score = 2  # Low score for no answer
-        elif len(answer_text) < 20:
-            score = 4  # Slightly higher for brief answer
-        elif len(answer_text) < 100:
-            score = 6  # Medium score for moderate answer
-        else:
-            score = 8  # Higher score for detailed answer
-        
-        # Adjust score based on positive/negative keywords
-        positive_keywords = ["strong", "comprehensive", "fully implemented", "excellent", "robust", 
-                            "mature", "advanced", "complete", "thorough", "effective"]
-        negative_keywords = ["weak", "lacking", "not implemented", "poor", "minimal", 
-                            "immature", "basic", "incomplete", "inadequate", "ineffective"]
-        
-        if any(kw in answer_text.lower() for kw in positive_keywords):
-            score = min(cat_def['max_score'], score + 2)
-        elif any(kw in answer_text.lower() for kw in negative_keywords):
-            score = max(0, score - 2)
-        
-        # Ensure score is within bounds
-        score = max(0, min(cat_def['max_score'], score))
+    # Basic scoring logic based on answer length and keywords, computed for all categories at once
+    lengths = np.fromiter(map(len, answer_texts), dtype=np.int64, count=count)
+    unanswered = np.fromiter((NO_ANSWER_RE.fullmatch(text) is not None for text in answer_texts), dtype=bool, count=count)
+    
+    # Keyword flags; a positive match wins, so the negative scan only runs when there is none
+    positive = np.fromiter((POSITIVE_KEYWORDS_RE.search(text) is not None for text in answer_texts), dtype=bool, count=count)
+    negative = np.fromiter(
+        (not pos and NEGATIVE_KEYWORDS_RE.search(text) is not None for text, pos in zip(answer_texts, positive)),
+        dtype=bool, count=count,
+    )
+    scores, weighted_sum = score_answers(
+        lengths, unanswered, positive, negative, _CATEGORY_MAX_SCORE_ARRAY, _CATEGORY_WEIGHTS,
+        ANSWER_LENGTH_BOUNDS, ANSWER_LENGTH_SCORES, NO_ANSWER_SCORE,
+    )
+    
+    # One conversion back to Python ints instead of unboxing a numpy scalar per row
+    for i, score in enumerate(scores.tolist()):
+        max_score = _CATEGORY_MAX_SCORES[i]
+        answer_text = answer_texts[i]
         
         # Generate explanation
-        explanation = f"Based on your response: '{answer_text[:100]}{'...' if len(answer_text) > 100 else ''}'. "
-        explanation += f"Assessment focused on {cat_def['scoring_focus']}."
+        explanation = f"Based on your response: '{answer_text[:100]}{'...' if len(answer_text) > 100 else ''}'. {_EXPLANATION_SUFFIXES[i]}"
         
-        # Create table row
-        table.append(RiskTableRow(
-            id=cat_def['id'],
-            category=cat_def['category'],
-            definition=cat_def['definition'],
-            scoring_focus=cat_def['scoring_focus'],
+        # Create table row; every field is built here from trusted values, so skip validation
+        table.append(RiskTableRow.model_construct(
+            id=_CATEGORY_IDS[i],
+            category=_CATEGORY_NAMES[i],
+            definition=_CATEGORY_DEFINITIONS[i],
+            scoring_focus=_CATEGORY_SCORING_FOCUS[i],
             score=score,
-            max_score=cat_def['max_score'],
-            weight=cat_def['weight'],
+            max_score=max_score,
+            weight=_CATEGORY_WEIGHT_VALUES[i],
             explanation=explanation
         ))
         
-        # Update totals
-        total_weighted_score_sum += score * cat_def['weight']
-        total_weight_sum += cat_def['weight']
-        
         # Add to insights
-        data_insights.append(f"{cat_def['category']} (Weight: {cat_def['weight']*100}%): Score {score}/{cat_def['max_score']}. {explanation}")
+        data_insights.append(f"{_INSIGHT_PREFIXES[i]}{score}/{max_score}. {explanation}")
     
     # Calculate normalized score (0-100)
-    overall_score_normalized = (total_weighted_score_sum / (10 * total_weight_sum)) * 100 if total_weight_sum > 0 else 0
+    overall_score_normalized = (weighted_sum / (10 * _CATEGORY_WEIGHT_TOTAL)) * 100 if _CATEGORY_WEIGHT_TOTAL > 0 else 0
     overall_score_normalized = round(overall_score_normalized, 2)
     
-    logger.info(f"Calculated risk table with {len(table)} rows. Overall weighted score: {overall_score_normalized}")
+    logger.debug("Calculated risk table with %d rows. Overall weighted score: %s", len(table), overall_score_normalized)
     return table, overall_score_normalized, data_insights
 
-async def retrieve_rag_context(profile: CompanyProfile, answers: Dict[str, str], risk_table: List[RiskTableRow]) -> str:
-    """Retrieve relevant context from the RAG system based on profile, answers, and risk table."""
+def build_profile_query(profile: CompanyProfile) -> str:
+    """The profile-dependent part of the retrieval query."""
+    return "\n".join([
+        f"Company industry: {profile.industry}",
+        f"Company size: {profile.size}",
+        f"Technology adoption level: {profile.tech_adoption}",
+        f"Security controls summary: {profile.security_controls[:150]}",
+        f"Risk posture summary: {profile.risk_posture[:150]}",
+        f"Emerging technologies: {', '.join(profile.emerging_technologies)}",
+    ])
+
+RAG_CONTEXT_SEPARATOR = "\n\n---\n\n"
+RAG_CONTEXT_SEPARATOR_LEN = len(RAG_CONTEXT_SEPARATOR)
+
+async def retrieve_rag_context(profile: CompanyProfile, answers: Dict[str, str], risk_table: List[RiskTableRow], profile_embedding: Optional[np.ndarray] = None) -> str:
+    """
+    Retrieve relevant context from the RAG system based on profile, answers, and risk table.
+    With the in-memory index, each of the three weakest areas gets its own query (its category
+    and answer, averaged with the profile embedding); they are embedded in one batch and searched
+    together. `profile_embedding` (of build_profile_query) saves re-embedding the profile.
+    """
     if not db:
         logger.error("Vector DB not initialized. Cannot retrieve context.")
         return "Vector DB not initialized."
 
     # Sort risks by score (ascending) to focus on highest risk areas
     sorted_risks = sorted(risk_table, key=lambda x: x.score)
-    high_risk_categories = [f"{r.category} ({r.scoring_focus})" for r in sorted_risks[:3]]  # Top 3 high-risk areas
+    high_risks = sorted_risks[:3]  # Top 3 high-risk areas
 
-    # Create query from profile and high-risk areas
-    query_parts = [
-        f"Company industry: {profile.industry}",
-        f"Company size: {profile.size}",
-        f"Technology adoption level: {profile.tech_adoption}",
-        f"Security controls summary: {profile.security_controls[:150]}",
-        f"Risk posture summary: {profile.risk_posture[:150]}",
-        f"Emerging technologies: {', '.join(profile.emerging_technologies)}",
-        f"Key risk areas: {', '.join(high_risk_categories)}"
-    ]
-    
-    # Add some key answers for context
-    for risk_id, answer in list(answers.items())[:3]:  # Add first 3 answers
-        category = next((cat['category'] for cat in RISK_CATEGORIES_DEFINITION if cat['id'] == risk_id), risk_id)
-        query_parts.append(f"Response about {category}: {answer[:100]}")
-    
-    query = "\n".join(query_parts)
-    logger.info(f"Retrieving RAG context with query (first 300 chars): {query[:300]}...")
-    
     try:
-        # Get relevant documents from vector store
-        docs = db.similarity_search(query, k=3)  # Get top 3 relevant chunks
+        # Get top 3 relevant chunks, from the in-memory index when available
+        if vector_index:
+            risk_queries = [
+                f"Key risk area: {r.category} ({r.scoring_focus})\nResponse: {answers.get(r.id, 'No answer provided')[:100]}"
+                for r in high_risks
+            ]
+            logger.debug("Retrieving RAG context for risk areas: %s", [r.category for r in high_risks])
+            texts = risk_queries if profile_embedding is not None else [build_profile_query(profile), *risk_queries]
+            # Concurrent submits share one embedder batch
+            embeddings = np.asarray(await asyncio.gather(*map(embed_async, texts)), dtype=np.float32)
+            if profile_embedding is None:
+                profile_embedding, embeddings = embeddings[0], embeddings[1:]
+            docs = vector_index.search_many(0.5 * profile_embedding + 0.5 * embeddings, k=3)
+        else:
+            # Create the answer-dependent part of the query from high-risk areas
+            answer_query_parts = [f"Key risk areas: {', '.join(f'{r.category} ({r.scoring_focus})' for r in high_risks)}"]
+
+            # Add some key answers for context
+            for risk_id, answer in list(answers.items())[:3]:  # Add first 3 answers
+                idx = _CATEGORY_INDEX.get(risk_id)
+                category = _CATEGORY_NAMES[idx] if idx is not None else risk_id
+                answer_query_parts.append(f"Response about {category}: {answer[:100]}")
+
+            answer_query = "\n".join(answer_query_parts)
+            logger.debug("Retrieving RAG context with query (first 300 chars): %.300s...", answer_query)
+            if profile_embedding is not None:
+                answer_embedding = np.asarray(await embed_async(answer_query), dtype=np.float32)
+                query_embedding = 0.5 * profile_embedding + 0.5 * answer_embedding
+                query_embedding /= np.linalg.norm(query_embedding) + 1e-12
+                docs = await run_rag_blocking(db.similarity_search_by_vector, query_embedding.tolist(), k=3)
+            else:
+                query = build_profile_query(profile) + "\n" + answer_query
+                docs = await run_rag_blocking(db.similarity_search, query, k=3)
         
-        # Process and truncate context to fit within limits
-        current_context_len = 0
+        # Process and truncate context to fit within limits: each document gets an equal
+        # share, and documents are dropped once the next one would overflow the total
+        doc_share = MAX_RAG_CONTEXT_CHARS // len(docs) - RAG_CONTEXT_SEPARATOR_LEN - 10 if docs else 0
+        remaining = MAX_RAG_CONTEXT_CHARS
         context_parts = []
-        separator = "\n\n---\n\n"
-        
         for doc in docs:
             source_info = f"Source: {doc.metadata.get('source', 'Unknown')}"
-            content = doc.page_content
-            
-            # Calculate budget for this document
-            per_doc_content_budget = (MAX_RAG_CONTEXT_CHARS // len(docs)) - len(source_info) - len(separator) - 10
-            per_doc_content_budget = max(50, per_doc_content_budget)  # Ensure minimum content
-            
-            # Truncate content to fit budget
-            truncated_content = content[:per_doc_content_budget]
-            doc_context_segment = f"{source_info}\nContent: {truncated_content}"
-            
-            # Check if adding this segment would exceed total budget
-            if current_context_len + len(doc_context_segment) + (len(separator) if context_parts else 0) > MAX_RAG_CONTEXT_CHARS:
+            # Ensure minimum content
+            doc_context_segment = f"{source_info}\nContent: {doc.page_content[:max(50, doc_share - len(source_info))]}"
+            cost = len(doc_context_segment) + (RAG_CONTEXT_SEPARATOR_LEN if context_parts else 0)
+            if cost > remaining:
                 break
-            
             context_parts.append(doc_context_segment)
-            current_context_len += len(doc_context_segment) + (len(separator) if len(context_parts) > 1 else 0)
+            remaining -= cost
 
         # Join context parts with separator
-        context = separator.join(context_parts)
-        logger.info(f"Retrieved and truncated RAG context from {len(context_parts)} documents. Total context length: {len(context)} chars.")
+        context = RAG_CONTEXT_SEPARATOR.join(context_parts)
+        logger.debug("Retrieved and truncated RAG context from %d documents. Total context length: %d chars.", len(context_parts), len(context))
     except Exception as e:
         logger.error(f"Error during RAG context retrieval: {e}", exc_info=True)
         context = f"Error retrieving RAG context: {str(e)}"
         
     return context
 
-async def generate_llm_advice_async(profile: CompanyProfile, answers: Dict[str, str], risk_table: List[RiskTableRow], context: str):
-    """Generate advice using the LLM based on profile, answers, risk table, and RAG context."""
-    if not qa_chain:
-        logger.error("QA chain not initialized. Cannot generate LLM advice.")
-        return ["LLM advice generation failed: RAG pipeline not ready."], [], "QA chain not initialized."
+_BRACE_RE = re.compile(r"[{}]")
+_JSON_DECODER = json.JSONDecoder()
+
+def extract_json_object(output: str, prompt_tail: Optional[str] = None) -> Optional[str]:
+    """
+    Return the first JSON object in the LLM output, or None if there is no '{'.
+    If the output may echo its prompt, pass the prompt's closing text as `prompt_tail`: the
+    scan then starts after it, so a JSON template in the prompt is never taken for the answer.
+    The object is delimited by the C JSON scanner, so braces inside string values are handled
+    and trailing prose is ignored. If it doesn't parse, fall back to the first balanced {...}
+    span (a linear scan over brace characters only), or the span up to the last '}' if the
+    braces never balance (e.g. truncated output).
+    """
+    tail = output.find(prompt_tail) if prompt_tail else -1
+    start = output.find("{", tail + len(prompt_tail) if tail >= 0 else 0)
+    if start < 0:
+        return None
+    try:
+        return output[start:_JSON_DECODER.raw_decode(output, start)[1]]
+    except ValueError:
+        pass
+    depth = 0
+    for match in _BRACE_RE.finditer(output, start):
+        depth += 1 if match.group() == "{" else -1
+        if depth == 0:
+            return output[start:match.end()]
+    end = output.rfind("}")
+    return output[start:end + 1] if end > start else None
+
+async def invoke_llm_batch(prompts: List[str]) -> List[str]:
+    """
+    Generate answers for a batch of advice prompts, in order. The prompts already carry the
+    context retrieve_rag_context took from the in-memory index, so they go straight to the LLM
+    without a second retrieval.
+    """
+    return await agenerate_answers(llm, prompts)
 
-    # Define static parts of the prompt
-    static_prompt_header = f"""
+async def invoke_llm(prompt: str) -> str:
+    """Generate an answer to a prompt, coalesced with concurrent callers by the micro-batcher."""
+    return await llm_batcher.submit(prompt)
+
+# Fixed text of the advice prompt, laid out around the truncated dynamic sections. The header
+# is identical for every request and comes first, with the retrieved context last, so a
+# backend with prefix caching can reuse the header's prefill
+ADVICE_PROMPT_HEADER = """
 You are an expert cybersecurity and emerging technology risk management advisor.
 Given the following company profile, their answers to risk assessment questions, the calculated risk table, and relevant context from governance documents, provide:
-1. Actionable, prioritized recommendations to mitigate identified risks and improve their posture for adopting emerging technologies ({', '.join(profile.emerging_technologies)}).
+1. Actionable, prioritized recommendations to mitigate identified risks and improve their posture for adopting the emerging technologies listed in the profile.
 2. Links to 2-3 key resources (from the provided context or well-known standards) that are most relevant to their highest risk areas.
 
-Respond ONLY with a single valid JSON object in the following format (no extra text before or after the JSON object):
+Respond with a JSON object in the following format:
 
-{{
+{
   "recommendations": [
     "Recommendation 1 (with brief rationale)...",
     "Recommendation 2 (with brief rationale)..."
   ],
   "resources": [
-    {{"title": "Resource Title 1", "url": "Resource URL 1 (if available from context, otherwise general standard)"}},
-    {{"title": "Resource Title 2", "url": "Resource URL 2"}}
+    {"title": "Resource Title 1", "url": "Resource URL 1 (if available from context, otherwise general standard)"},
+    {"title": "Resource Title 2", "url": "Resource URL 2"}
   ],
   "rawLLMOutput": "Your detailed thought process and summary of key risks observed before formulating recommendations."
-}}
+}
 
 Company Profile:
 """
-    static_prompt_answers_header = "\n\nRisk Assessment Answers:\n"
-    static_prompt_table_header = "\n\nCalculated Risk Table (Scores out of 10, lower is worse):\n"
-    static_prompt_context_header = "\n\nRelevant Context from Knowledge Base:\n"
-    static_prompt_footer = "\n\nFocus on providing practical, actionable advice. Prioritize recommendations based on the risk scores (lower scores indicate higher risk) and their weights.\n"""
-
-    # Calculate lengths of static parts
-    len_static_prompt = (
-        len(static_prompt_header) +
-        len(static_prompt_answers_header) +
-        len(static_prompt_table_header) +
-        len(static_prompt_context_header) +
-        len(static_prompt_footer)
-    )
-    logger.info(f"Static prompt parts total length: {len_static_prompt} chars")
+ADVICE_PROMPT_ANSWERS_HEADER = "\n\nRisk Assessment Answers:\n"
+ADVICE_PROMPT_TABLE_HEADER = "\n\nCalculated Risk Table (Scores out of 10, lower is worse):\n"
+ADVICE_PROMPT_CONTEXT_HEADER = "\n\nRelevant Context from Knowledge Base:\n"
+ADVICE_PROMPT_FOOTER = "\n\nFocus on providing practical, actionable advice. Prioritize recommendations based on the risk scores (lower scores indicate higher risk) and their weights.\n"
+ADVICE_PROMPT_STATIC_PARTS = (
+    ADVICE_PROMPT_HEADER, ADVICE_PROMPT_ANSWERS_HEADER, ADVICE_PROMPT_TABLE_HEADER, ADVICE_PROMPT_CONTEXT_HEADER, ADVICE_PROMPT_FOOTER,
+)
+
+def count_tokens(text: str) -> int:
+    """Number of LLM tokens in `text`."""
+    return len(prompt_tokenizer(text, add_special_tokens=False)["input_ids"])
+
+def truncate_to_tokens(text: str, max_tokens: int) -> tuple[str, int]:
+    """
+    Cut `text` to at most `max_tokens` LLM tokens, at a token boundary of the original string
+    (via the offset mapping, so nothing is re-decoded). Returns the text and its token count.
+    """
+    if max_tokens <= 0:
+        return "", 0
+    offsets = prompt_tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+    if len(offsets) <= max_tokens:
+        return text, len(offsets)
+    return text[:offsets[max_tokens - 1][1]], max_tokens
+
+@lru_cache(maxsize=1)
+def advice_prompt_static_tokens() -> int:
+    """Tokens taken by the fixed parts of the advice prompt; the tokenizer is fixed after startup."""
+    return sum(map(count_tokens, ADVICE_PROMPT_STATIC_PARTS))
+
+def build_advice_cache_key(profile: CompanyProfile, answers: Dict[str, str], sorted_risk_rows: List[RiskTableRow]) -> tuple[str, str]:
+    """
+    What the advice mostly depends on, as `(bucket, text)` for the semantic cache. The bucket
+    holds the structured fields that must match exactly (the profile's categories and the
+    three lowest-scoring categories with their scores), so one company is never served advice
+    written for a different industry, size or risk profile. Only the free text (the stated
+    controls and posture, and the answers in the weakest areas) is matched by similarity.
+    The full prompt also carries retrieved context, which varies between otherwise
+    equivalent submissions and would make cache hits rare.
+    """
+    weakest = sorted_risk_rows[:3]
+    bucket = orjson.dumps([
+        profile.industry, profile.size, profile.tech_adoption, sorted(profile.emerging_technologies),
+        [(row.id, row.score) for row in weakest],
+    ]).decode()
+    text = "\n".join((
+        f"Stated Controls: {profile.security_controls}",
+        f"Stated Posture: {profile.risk_posture}",
+        *(f"{row.id}: {answers.get(row.id, '')}" for row in weakest),
+    ))
+    return bucket, text
+
+def build_advice_prompt(profile: CompanyProfile, answers: Dict[str, str], sorted_risk_rows: List[RiskTableRow], context: str) -> str:
+    """Assemble the advice prompt, truncating each dynamic section to its share of the budget."""
+    len_static_prompt = advice_prompt_static_tokens()
+    logger.debug("Static prompt parts total length: %d tokens", len_static_prompt)
 
     # Calculate budget for dynamic parts
-    budget_for_other_dynamic_parts = TARGET_LLM_PROMPT_TOTAL_CHARS - len_static_prompt - len(context)
-    logger.info(f"RAG context length: {len(context)} chars (Max allowed: {MAX_RAG_CONTEXT_CHARS})")
-    logger.info(f"Budget for (profile + answers + table): {budget_for_other_dynamic_parts} chars")
+    context_tokens = count_tokens(context)
+    budget_for_other_dynamic_parts = TARGET_LLM_PROMPT_TOTAL_TOKENS - len_static_prompt - context_tokens
+    logger.debug("RAG context length: %d tokens (%d chars, max allowed: %d)", context_tokens, len(context), MAX_RAG_CONTEXT_CHARS)
+    logger.debug("Budget for (profile + answers + table): %d tokens", budget_for_other_dynamic_parts)
 
     # Handle case where static + context already exceeds target
     if budget_for_other_dynamic_parts < 0:
-        logger.warning(f"Static prompt ({len_static_prompt}) + RAG context ({len(context)}) exceeds target total ({TARGET_LLM_PROMPT_TOTAL_CHARS}). Truncating RAG context further.")
-        context = context[:max(0, MAX_RAG_CONTEXT_CHARS // 2)]  # Drastically reduce context
-        budget_for_other_dynamic_parts = TARGET_LLM_PROMPT_TOTAL_CHARS - len_static_prompt - len(context)
-        logger.info(f"Further truncated RAG context to: {len(context)} chars. New budget: {budget_for_other_dynamic_parts}")
+        logger.warning(f"Static prompt ({len_static_prompt}) + RAG context ({context_tokens}) exceeds target total ({TARGET_LLM_PROMPT_TOTAL_TOKENS} tokens). Truncating RAG context further.")
+        context, context_tokens = truncate_to_tokens(context, context_tokens // 2)  # Drastically reduce context
+        budget_for_other_dynamic_parts = TARGET_LLM_PROMPT_TOTAL_TOKENS - len_static_prompt - context_tokens
+        logger.debug("Further truncated RAG context to: %d tokens. New budget: %d", context_tokens, budget_for_other_dynamic_parts)
 
     # Prepare full dynamic content
     profile_info_full = f"Industry: {profile.industry}, Size: {profile.size}, Tech Adoption: {profile.tech_adoption}, Stated Controls: {profile.security_controls}, Stated Posture: {profile.risk_posture}, Emerging Tech: {', '.join(profile.emerging_technologies)}"
     
     # Focus on high-risk answers for the LLM
-    sorted_risk_rows = sorted(risk_table, key=lambda x: x.score)
     high_risk_answers = {}
     for row in sorted_risk_rows[:5]:  # Top 5 risk areas
         if row.id in answers:
             high_risk_answers[row.id] = answers[row.id]
     
-    answers_json_full = json.dumps(high_risk_answers, indent=2)
-    risk_table_json_full = json.dumps([rt.dict() for rt in sorted_risk_rows[:8]], indent=2)  # Top 8 risk areas
+    answers_json_full = orjson.dumps(high_risk_answers).decode()
+    risk_table_json_full = RISK_TABLE_ADAPTER.dump_json(sorted_risk_rows[:8]).decode()  # Top 8 risk areas
 
     # Allocate budget for dynamic parts
-    profile_chars_limit = int(budget_for_other_dynamic_parts * 0.20)
-    answers_json_chars_limit = int(budget_for_other_dynamic_parts * 0.40)
-    risk_table_json_chars_limit = int(budget_for_other_dynamic_parts * 0.40)
+    profile_tokens_limit = int(budget_for_other_dynamic_parts * 0.20)
+    answers_json_tokens_limit = int(budget_for_other_dynamic_parts * 0.40)
+    risk_table_json_tokens_limit = int(budget_for_other_dynamic_parts * 0.40)
 
     # Truncate dynamic parts
-    truncated_profile_info = profile_info_full[:profile_chars_limit]
-    truncated_answers_json = answers_json_full[:answers_json_chars_limit]
-    truncated_risk_table_json = risk_table_json_full[:risk_table_json_chars_limit]
-
-    logger.info(f"Dynamic content lengths (chars) - Profile: {len(truncated_profile_info)}/{profile_chars_limit}, Answers: {len(truncated_answers_json)}/{answers_json_chars_limit}, RiskTable: {len(truncated_risk_table_json)}/{risk_table_json_chars_limit}")
-
-    # Assemble final prompt
-    prompt = (
-        static_prompt_header + truncated_profile_info +
-        static_prompt_answers_header + truncated_answers_json +
-        static_prompt_table_header + truncated_risk_table_json +
-        static_prompt_context_header + context +
-        static_prompt_footer
+    truncated_profile_info, profile_tokens = truncate_to_tokens(profile_info_full, profile_tokens_limit)
+    truncated_answers_json, answers_json_tokens = truncate_to_tokens(answers_json_full, answers_json_tokens_limit)
+    truncated_risk_table_json, risk_table_json_tokens = truncate_to_tokens(risk_table_json_full, risk_table_json_tokens_limit)
+
+    logger.debug(
+        "Dynamic content lengths (tokens) - Profile: %d/%d, Answers: %d/%d, RiskTable: %d/%d",
+        profile_tokens, profile_tokens_limit, answers_json_tokens, answers_json_tokens_limit, risk_table_json_tokens, risk_table_json_tokens_limit,
     )
-    final_prompt_len = len(prompt)
-    logger.info(f"Final assembled prompt length: {final_prompt_len} chars. Target: {TARGET_LLM_PROMPT_TOTAL_CHARS}")
+
+    # Assemble final prompt in one pass
+    prompt = "".join((
+        ADVICE_PROMPT_HEADER, truncated_profile_info,
+        ADVICE_PROMPT_ANSWERS_HEADER, truncated_answers_json,
+        ADVICE_PROMPT_TABLE_HEADER, truncated_risk_table_json,
+        ADVICE_PROMPT_CONTEXT_HEADER, context,
+        ADVICE_PROMPT_FOOTER,
+    ))
+    final_prompt_len = count_tokens(prompt)
+    logger.debug("Final assembled prompt length: %d tokens. Target: %d", final_prompt_len, TARGET_LLM_PROMPT_TOTAL_TOKENS)
 
     # Warning if prompt is still too long
-    if final_prompt_len > TARGET_LLM_PROMPT_TOTAL_CHARS * 1.05:
-        logger.warning(f"WARNING: Final prompt length {final_prompt_len} significantly exceeds target {TARGET_LLM_PROMPT_TOTAL_CHARS}. LLM call might fail or be truncated by model.")
+    if final_prompt_len > TARGET_LLM_PROMPT_TOTAL_TOKENS * 1.05:
+        logger.warning(f"WARNING: Final prompt length {final_prompt_len} tokens significantly exceeds target {TARGET_LLM_PROMPT_TOTAL_TOKENS}. LLM call might fail or be truncated by model.")
+    return prompt
+
+async def generate_llm_advice_async(profile: CompanyProfile, answers: Dict[str, str], risk_table: List[RiskTableRow], profile_embedding: Optional[np.ndarray] = None):
+    """
+    Generate advice using the LLM based on profile, answers, risk table, and RAG context.
+    The semantic cache is consulted first, so a hit skips RAG retrieval as well as the LLM.
+    """
+    if not llm:
+        logger.error("LLM not initialized. Cannot generate LLM advice.")
+        return ["LLM advice generation failed: RAG pipeline not ready."], [], "LLM not initialized."
+
+    sorted_risk_rows = sorted(risk_table, key=lambda x: x.score)
+
+    async def retrieve_and_generate(_cache_key: str) -> str:
+        context = await retrieve_rag_context(profile, answers, risk_table, profile_embedding)
+        logger.debug("Retrieved RAG context of length: %d", len(context))
+        prompt = build_advice_prompt(profile, answers, sorted_risk_rows, context)
+        logger.debug("Invoking LLM with prompt...")
+        return await invoke_llm(prompt)
 
     try:
-        # Invoke LLM
-        logger.info("Invoking LLM with prompt...")
-        result = qa_chain.invoke({"query": prompt})
-        output = result.get("result", "")
-        logger.info(f"Raw LLM output received (first 500 chars): {output[:500]}...")
-
-        # Parse JSON response
-        match = re.search(r'\{[\s\S]*\}', output)
-        if match:
-            json_str = match.group(0)
+        # Submissions with the same profile categories and weakest-area scores, and near-identical
+        # free-text answers, are answered from the semantic cache
+        cache_bucket, cache_text = build_advice_cache_key(profile, answers, sorted_risk_rows)
+        output = await llm_cache.get_or_compute(cache_text, retrieve_and_generate, bucket=cache_bucket)
+        logger.debug("Raw LLM output received (first 500 chars): %.500s...", output)
+
+        # Parse JSON response; with guided decoding the generated text is the JSON object itself,
+        # so only unguided output has to be searched for one
+        json_str = output if LLM_GUIDED_JSON else extract_json_object(output, ADVICE_PROMPT_FOOTER)
+        if json_str:
             try:
-                structured_response = json.loads(json_str)
+                structured_response = orjson.loads(json_str)
                 recommendations = structured_response.get("recommendations", ["LLM failed to provide structured recommendations."])
                 resources = structured_response.get("resources", [])
                 raw_llm_summary = structured_response.get("rawLLMOutput", output)
-                logger.info("Successfully parsed LLM JSON response.")
-            except json.JSONDecodeError as e:
+                logger.debug("Successfully parsed LLM JSON response.")
+            except orjson.JSONDecodeError as e:
                 logger.error(f"Failed to decode JSON from LLM output: {e}\nOutput was: {json_str}")
                 recommendations = ["LLM response was not valid JSON. Please check logs."]
                 resources = []
@@ -535,18 +1038,11 @@ Company Profile:
         raw_llm_summary = f"Error: {str(e)}"
     
     # Ensure we have at least some recommendations
-    if not recommendations or len(recommendations) == 0:
-        recommendations = [
-            "Implement a formal risk assessment process for emerging technology adoption.",
-            "Develop a comprehensive security framework aligned with industry standards.",
-            "Establish clear governance procedures for technology evaluation and implementation."
-        ]
+    if not recommendations:
+        recommendations = DEFAULT_RECOMMENDATIONS
     
     # Ensure we have at least some resources
-    if not resources or len(resources) == 0:
-        resources = [
-            {"title": "NIST Cybersecurity Framework", "url": "https://www.nist.gov/cyberframework"},
-            {"title": "ISO/IEC 27001 Information Security Management", "url": "https://www.iso.org/isoiec-27001-information-security.html"}
-        ]
+    if not resources:
+        resources = DEFAULT_RESOURCES
     
     return recommendations, resources, raw_llm_summary
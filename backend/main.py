@@ -1,12 +1,12 @@
 ### main.py
-from rag_pipeline.loader import load_documents, chunk_documents
+from rag_pipeline.loader import iter_documents, chunk_documents
 from rag_pipeline.embedder import get_embedder
 from rag_pipeline.store import store_embeddings
-from rag_pipeline.retriever import build_rag_chain
+from rag_pipeline.retriever import build_rag_chain, stream_rag_answer
 
 def main():
     print("Loading and processing documents...")
-    docs = load_documents("data/")
+    docs = iter_documents("data/")
     chunks = chunk_documents(docs)
 
     print("Embedding documents...")
@@ -20,10 +20,13 @@ def main():
         query = input("\nAsk a risk-related question (or type 'exit'): ")
         if query.lower() in ['exit', 'quit']:
             break
-        response = qa_chain.run(query)
-        print("\nAnswer:", response["result"])
-        print("Sources:")
-        for doc in response["source_documents"]:
+        # Print tokens as they are generated instead of waiting for the whole answer
+        chunks, sources = stream_rag_answer(qa_chain, query)
+        print("\nAnswer: ", end="", flush=True)
+        for text in chunks:
+            print(text, end="", flush=True)
+        print("\nSources:")
+        for doc in sources:
             print(f"- {doc.metadata}")
 
 if __name__ == "__main__":
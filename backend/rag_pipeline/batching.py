@@ -0,0 +1,122 @@
+# rag_pipeline/batching.py
+# ------------------
+# Coalesces concurrent single-item calls into batched calls
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Generic, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Collect items submitted by concurrent callers and hand them to `batch_fn` together.
+
+    A background worker waits for the first item, then keeps collecting for up to
+    `max_wait_ms` or until `max_batch_size` items are queued, and resolves each caller's
+    future with the matching element of `batch_fn`'s result list. At most `max_concurrency`
+    batches run at once (e.g. how many generate calls fit in GPU memory together); the next
+    batch is only collected once a slot is free, so items queued meanwhile join it.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[list[T]], Awaitable[list[R]]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 20.0,
+        name: str = "batcher",
+        max_concurrency: int = 1,
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self._queue: asyncio.Queue[tuple[T, asyncio.Future]] | None = None
+        self._worker: asyncio.Task | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._dispatches: set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        """Start the background worker on the running event loop."""
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Cancel the background worker and fail any callers still waiting."""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        for task in self._dispatches:
+            task.cancel()
+        await asyncio.gather(*self._dispatches, return_exceptions=True)
+        while not self._queue.empty():
+            _, fut = self._queue.get_nowait()
+            if not fut.done():
+                fut.set_exception(RuntimeError(f"{self.name} stopped"))
+
+    async def submit(self, item: T) -> R:
+        """Queue `item` for the next batch and wait for its result."""
+        if self._worker is None:
+            raise RuntimeError(f"{self.name} is not running")
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, fut))
+        return await fut
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._slots.acquire()
+            try:
+                batch = [await self._queue.get()]
+            except BaseException:
+                self._slots.release()
+                raise
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            task = loop.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatch_done)
+
+    def _dispatch_done(self, task: asyncio.Task) -> None:
+        self._dispatches.discard(task)
+        self._slots.release()
+
+    async def _dispatch(self, batch: list[tuple[T, asyncio.Future]]) -> None:
+        pending = [(item, fut) for item, fut in batch if not fut.cancelled()]
+        if not pending:
+            return
+        logger.debug("%s: dispatching batch of %d", self.name, len(pending))
+        try:
+            results: list[Any] = await self.batch_fn([item for item, _ in pending])
+        except asyncio.CancelledError:
+            for _, fut in pending:
+                if not fut.done():
+                    fut.set_exception(RuntimeError(f"{self.name} stopped"))
+            raise
+        except Exception as e:
+            for _, fut in pending:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (_, fut), result in zip(pending, results):
+            if not fut.done():
+                fut.set_result(result)
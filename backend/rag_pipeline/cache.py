@@ -0,0 +1,278 @@
+# rag_pipeline/cache.py
+# ------------------
+# Semantic response cache placed in front of the LLM chain
+
+import asyncio
+import hashlib
+import inspect
+import logging
+import os
+import re
+import threading
+import time
+from typing import Awaitable, Callable, Optional, Union
+
+import numpy as np
+import orjson
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 15 * 60
+DEFAULT_DISTANCE_THRESHOLD = 0.12
+DEFAULT_MAX_ENTRIES = 1024
+
+CACHE_EMBEDDINGS_FILE = "embeddings.npy"
+CACHE_ENTRIES_FILE = "entries.json"
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Collapse whitespace and case so trivially different prompts share a cache key.
+    """
+    return _WHITESPACE_RE.sub(" ", prompt.strip().lower())
+
+
+class SemanticCache:
+    """
+    In-process cache mapping prompts to LLM responses.
+
+    Lookups first try an exact match on the SHA-256 of the normalized prompt. On a miss the
+    prompt is embedded and compared against the embeddings of every cached prompt; the
+    nearest one is returned if its cosine distance is below `distance_threshold`. A lookup
+    can be given a `bucket`: it then only matches entries stored with the same bucket, so
+    fields that must agree exactly are never traded for similarity of the rest.
+    Entries expire after `ttl_seconds`. The cache can be saved to and restored from a directory
+    so it stays warm across restarts.
+
+    `get_or_compute` embeds through `embed_async` when given (e.g. a shared batcher), otherwise
+    in a worker thread, so a lookup never runs the embedding model on the event loop.
+    Concurrent misses on the same normalized prompt (e.g. a double-clicked submit) share one
+    computation. `save` may run in a worker thread while requests use the cache, so changes
+    to the entries go through a lock.
+    """
+
+    def __init__(
+        self,
+        embedder,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        distance_threshold: float = DEFAULT_DISTANCE_THRESHOLD,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        embed_async: Optional[Callable[[str], Awaitable[list[float]]]] = None,
+    ):
+        self.embedder = embedder
+        self.embed_async = embed_async
+        self.ttl_seconds = ttl_seconds
+        self.distance_threshold = distance_threshold
+        self.max_entries = max_entries
+        # key -> (expires_at, response)
+        self._entries: dict[str, tuple[float, str]] = {}
+        # Row i of `_vectors` is the unit-length embedding of the prompt stored under `_keys[i]`,
+        # in bucket `_buckets[i]`
+        self._keys: list[str] = []
+        self._buckets: list[str] = []
+        self._vectors: np.ndarray | None = None
+        self._dirty = False
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        # key -> task computing that prompt's response, shared by concurrent identical misses
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    @staticmethod
+    def _key(norm: str, bucket: str = "") -> str:
+        return hashlib.sha256(f"{bucket}\0{norm}".encode("utf-8")).hexdigest()
+
+    def _embed(self, norm: str) -> np.ndarray:
+        return self._unit(self.embedder.embed_query(norm))
+
+    async def _aembed(self, norm: str) -> np.ndarray:
+        if self.embed_async is not None:
+            return self._unit(await self.embed_async(norm))
+        return await asyncio.to_thread(self._embed, norm)
+
+    @staticmethod
+    def _unit(embedding) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32)
+        return vec / (np.linalg.norm(vec) + 1e-12)
+
+    def _evict_expired(self, now: float) -> None:
+        expired = {k for k, (expires_at, _) in self._entries.items() if expires_at <= now}
+        if len(self._entries) - len(expired) >= self.max_entries:
+            # Still full: drop the entries closest to expiry
+            survivors = sorted(
+                (k for k in self._entries if k not in expired),
+                key=lambda k: self._entries[k][0],
+            )
+            expired.update(survivors[: len(survivors) - self.max_entries + 1])
+        if not expired:
+            return
+        for k in expired:
+            del self._entries[k]
+        keep = [i for i, k in enumerate(self._keys) if k not in expired]
+        self._keys = [self._keys[i] for i in keep]
+        self._buckets = [self._buckets[i] for i in keep]
+        self._vectors = self._vectors[keep] if keep and self._vectors is not None else None
+
+    def _exact(self, norm: str, bucket: str) -> str | None:
+        entry = self._entries.get(self._key(norm, bucket))
+        if entry and entry[0] > time.time():
+            logger.info("Semantic cache exact hit")
+            self.hits += 1
+            return entry[1]
+        return None
+
+    def _nearest(self, vec: np.ndarray, bucket: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            rows = [i for i, b in enumerate(self._buckets) if b == bucket]
+            if self._vectors is None or not rows:
+                return None
+            sims = self._vectors[rows] @ vec
+            best = int(np.argmax(sims))
+            entry = self._entries.get(self._keys[rows[best]])
+        distance = 1.0 - float(sims[best])
+        if distance < self.distance_threshold and entry and entry[0] > now:
+            logger.info(f"Semantic cache similarity hit (cosine distance {distance:.4f})")
+            self.hits += 1
+            return entry[1]
+        return None
+
+    def store(self, norm: str, response: str, vec: np.ndarray, bucket: str = "") -> None:
+        """Cache `response` under `norm` in `bucket`; `vec` is the unit-length embedding of `norm`."""
+        key = self._key(norm, bucket)
+        with self._lock:
+            now = time.time()
+            self._evict_expired(now)
+            if key not in self._entries:
+                self._keys.append(key)
+                self._buckets.append(bucket)
+                self._vectors = vec[None, :] if self._vectors is None else np.vstack([self._vectors, vec])
+            self._entries[key] = (now + self.ttl_seconds, response)
+            self._dirty = True
+
+    def clear(self) -> None:
+        """Drop every entry, e.g. when the knowledge base the responses drew on was rebuilt."""
+        with self._lock:
+            self._entries = {}
+            self._keys = []
+            self._buckets = []
+            self._vectors = None
+            self._dirty = True
+
+    async def get_or_compute(
+        self,
+        prompt: str,
+        compute: Callable[[str], Union[str, Awaitable[str]]],
+        bucket: str = "",
+    ) -> str:
+        """
+        Return the cached response for `prompt` (or a semantically close one in the same
+        `bucket`), otherwise call `compute(prompt)`, cache its result and return it. `compute`
+        may be sync or async, and is only called on a miss, so callers can key on a short
+        summary and defer building the full prompt to `compute`.
+        """
+        norm = normalize_prompt(prompt)
+        cached = self._exact(norm, bucket)
+        if cached is not None:
+            return cached
+        key = self._key(norm, bucket)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._lookup_or_compute(prompt, norm, compute, bucket))
+            self._inflight[key] = task
+
+            def done(task: asyncio.Task) -> None:
+                self._inflight.pop(key, None)
+                if not task.cancelled():
+                    task.exception()  # waiters see it through their own await
+
+            task.add_done_callback(done)
+        # Shielded so one caller giving up doesn't cancel the work the others are waiting on
+        return await asyncio.shield(task)
+
+    async def _lookup_or_compute(
+        self,
+        prompt: str,
+        norm: str,
+        compute: Callable[[str], Union[str, Awaitable[str]]],
+        bucket: str,
+    ) -> str:
+        vec = await self._aembed(norm)
+        cached = self._nearest(vec, bucket)
+        if cached is not None:
+            return cached
+
+        self.misses += 1
+        result = compute(prompt)
+        if inspect.isawaitable(result):
+            result = await result
+        self.store(norm, result, vec, bucket)
+        return result
+
+    def save(self, cache_dir: str) -> bool:
+        """
+        Write unexpired entries to `cache_dir` if anything changed since the last save.
+        Returns True if files were written.
+        """
+        with self._lock:
+            if not self._dirty:
+                return False
+            self._evict_expired(time.time())
+            rows = [(key, *self._entries[key], bucket) for key, bucket in zip(self._keys, self._buckets)]
+            vectors = self._vectors if self._vectors is not None else np.empty((0, 0), dtype=np.float32)
+            self._dirty = False
+        try:
+            self._write(cache_dir, rows, vectors)
+        except BaseException:
+            self._dirty = True
+            raise
+        logger.info(f"Saved {len(rows)} semantic cache entries to {cache_dir}")
+        return True
+
+    @staticmethod
+    def _write(cache_dir: str, rows: list, vectors: np.ndarray) -> None:
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # Write to temp files and swap in, so a crash mid-save never leaves a torn cache
+        emb_path = os.path.join(cache_dir, CACHE_EMBEDDINGS_FILE)
+        entries_path = os.path.join(cache_dir, CACHE_ENTRIES_FILE)
+        with open(emb_path + ".tmp", "wb") as f:
+            np.save(f, vectors)
+        with open(entries_path + ".tmp", "wb") as f:
+            f.write(orjson.dumps(rows))
+        os.replace(emb_path + ".tmp", emb_path)
+        os.replace(entries_path + ".tmp", entries_path)
+
+    def load(self, cache_dir: str) -> int:
+        """
+        Restore entries previously written by `save`, skipping expired ones.
+        Returns the number of entries loaded.
+        """
+        emb_path = os.path.join(cache_dir, CACHE_EMBEDDINGS_FILE)
+        entries_path = os.path.join(cache_dir, CACHE_ENTRIES_FILE)
+        if not (os.path.exists(emb_path) and os.path.exists(entries_path)):
+            return 0
+        try:
+            vectors = np.load(emb_path, mmap_mode="r")
+            with open(entries_path, "rb") as f:
+                rows = orjson.loads(f.read())
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable semantic cache in {cache_dir}: {e}")
+            return 0
+        if len(rows) != len(vectors):
+            logger.warning(f"Semantic cache in {cache_dir} is inconsistent; ignoring it.")
+            return 0
+
+        now = time.time()
+        keep = [i for i, row in enumerate(rows) if row[1] > now][-self.max_entries:]
+        with self._lock:
+            self._entries = {rows[i][0]: (rows[i][1], rows[i][2]) for i in keep}
+            self._keys = [rows[i][0] for i in keep]
+            # Rows saved before buckets existed are in the default bucket
+            self._buckets = [rows[i][3] if len(rows[i]) > 3 else "" for i in keep]
+            self._vectors = np.array(vectors[keep], dtype=np.float32) if keep else None
+            self._dirty = False
+        logger.info(f"Loaded {len(keep)} semantic cache entries from {cache_dir}")
+        return len(keep)
@@ -0,0 +1,27 @@
+# rag_pipeline/cpu.py
+# ------------------
+# Detects which int8 instruction set the CPU offers, for picking quantized model builds
+
+import platform
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def int8_cpu_target(cpuinfo_path: str = "/proc/cpuinfo") -> str:
+    """
+    The best int8 kernel family this CPU runs: "arm64", "avx512_vnni", "avx512" or "avx2".
+    Falls back to "avx2", which every x86-64 target here can run, when the CPU flags can't be
+    read (e.g. not Linux).
+    """
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "arm64"
+    try:
+        with open(cpuinfo_path) as f:
+            flags = next((line for line in f if line.startswith("flags")), "").split()
+    except OSError:
+        flags = []
+    if "avx512_vnni" in flags:
+        return "avx512_vnni"
+    if "avx512f" in flags:
+        return "avx512"
+    return "avx2"
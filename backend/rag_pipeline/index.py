@@ -0,0 +1,208 @@
+# rag_pipeline/index.py
+# ------------------
+# In-memory ANN index over the persisted vector store, used for request-time retrieval
+
+import hashlib
+import logging
+import os
+
+import hnswlib
+import numpy as np
+from langchain_core.documents import Document
+
+try:
+    import simsimd
+except ImportError:  # optional; int8 search falls back to blockwise numpy
+    simsimd = None
+
+logger = logging.getLogger(__name__)
+
+HNSW_INDEX_FILE = "hnsw.bin"
+# Written next to the index: which collection rows (and embedder) its labels refer to
+HNSW_FINGERPRINT_FILE = "hnsw.fingerprint"
+# Graph degree and build/search beam widths; HNSW_EF_SEARCH is the recall/latency knob
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+# Below this many vectors an exact matrix-vector product beats HNSW graph traversal
+BRUTE_FORCE_MAX_VECTORS = int(os.getenv("VECTOR_INDEX_BRUTE_FORCE_MAX", "5000"))
+# Rows scored per step when the matrix is int8; the int32 upcast of a block stays cache-sized
+INT8_SCORE_BLOCK_ROWS = 4096
+# Rows fetched from the store per call when loading; a single get() of a large collection
+# materializes every embedding as a Python list of floats first
+LOAD_PAGE_ROWS = 10_000
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    return matrix / (np.linalg.norm(matrix, axis=-1, keepdims=True) + 1e-12)
+
+
+def _quantize_rows(matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric per-row int8 quantization: `matrix ~= q * scales[:, None]`.
+    """
+    scales = np.abs(matrix).max(axis=-1, keepdims=True) / 127.0 + 1e-12
+    q = np.round(matrix / scales).astype(np.int8)
+    return q, scales[..., 0].astype(np.float32)
+
+
+def _read_text(path: str) -> str | None:
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+class VectorIndex:
+    """
+    Cosine-similarity index over every embedding in the vector store, with the matching
+    documents held in memory so a query never touches the store's sqlite layer.
+
+    Small corpora are searched exactly with one matrix-vector product over a row-normalized
+    matrix, optionally stored as int8 with per-row scales (a quarter of the memory); larger
+    corpora use an HNSW graph.
+    """
+
+    def __init__(
+        self,
+        documents: list[Document],
+        matrix: np.ndarray | None = None,
+        index: hnswlib.Index | None = None,
+        scales: np.ndarray | None = None,
+    ):
+        self.documents = documents
+        self.matrix = matrix
+        self.index = index
+        # Per-row dequantization scales when `matrix` is int8
+        self.scales = scales
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    @classmethod
+    def from_chroma(cls, db, persist_dir: str | None = None, quantize: bool = False, embedder_id: str = "") -> "VectorIndex | None":
+        """
+        Build the index from a Chroma store. When `persist_dir` is given an HNSW index is saved
+        there and reloaded on later startups only if its fingerprint still matches: a hash of
+        the collection id, its row ids in load order and `embedder_id` (the model the vectors
+        came from), so a re-ingested collection of the same size is never served by a graph
+        whose labels point at other documents.
+        `quantize` stores the exact-search matrix as int8 (hnswlib has no quantized storage, so
+        it has no effect above BRUTE_FORCE_MAX_VECTORS). Returns None if the store is empty.
+        """
+        fingerprint = hashlib.blake2b(f"{db._collection.id}\n{embedder_id}\n".encode(), digest_size=16)
+        embeddings, documents = cls._load_collection(db._collection, fingerprint)
+        if embeddings is None:
+            logger.warning("Vector store is empty; in-memory index not built.")
+            return None
+        count, dim = embeddings.shape
+        if count <= BRUTE_FORCE_MAX_VECTORS:
+            logger.info(f"Using exact search over {count} vectors (dim={dim}, {'int8' if quantize else 'float32'})")
+            matrix = _normalize_rows(embeddings)
+            if quantize:
+                matrix, scales = _quantize_rows(matrix)
+                return cls(documents, matrix=matrix, scales=scales)
+            return cls(documents, matrix=matrix)
+
+        if quantize:
+            logger.info("int8 storage applies to exact search only; the HNSW index keeps float32 vectors")
+        index = hnswlib.Index(space="cosine", dim=dim)
+
+        path = os.path.join(persist_dir, HNSW_INDEX_FILE) if persist_dir else None
+        fingerprint_path = os.path.join(persist_dir, HNSW_FINGERPRINT_FILE) if persist_dir else None
+        fingerprint = fingerprint.hexdigest()
+        if path and os.path.exists(path):
+            if _read_text(fingerprint_path) != fingerprint:
+                logger.info("Persisted HNSW index was built from different vectors; rebuilding.")
+            else:
+                try:
+                    index.load_index(path, max_elements=count)
+                    index.set_ef(HNSW_EF_SEARCH)
+                    logger.info(f"Loaded HNSW index with {count} vectors from {path}")
+                    return cls(documents, index=index)
+                except RuntimeError as e:
+                    logger.warning(f"Failed to load HNSW index from {path}: {e}. Rebuilding.")
+                index = hnswlib.Index(space="cosine", dim=dim)
+
+        index.init_index(max_elements=count, M=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION)
+        index.add_items(embeddings, np.arange(count))
+        index.set_ef(HNSW_EF_SEARCH)
+        if path:
+            index.save_index(path)
+            with open(fingerprint_path, "w") as f:
+                f.write(fingerprint)
+        logger.info(f"Built HNSW index with {count} vectors (dim={dim})")
+        return cls(documents, index=index)
+
+    @staticmethod
+    def _load_collection(collection, fingerprint) -> tuple[np.ndarray | None, list[Document]]:
+        """
+        Read every embedding and document from a Chroma collection, a page at a time, into one
+        preallocated float32 matrix, feeding the row ids to the `fingerprint` hash in order.
+        Returns `(None, [])` if the collection is empty.
+        """
+        total = collection.count()
+        embeddings = None
+        documents: list[Document] = []
+        for offset in range(0, total, LOAD_PAGE_ROWS):
+            page = collection.get(include=["embeddings", "documents", "metadatas"], limit=min(LOAD_PAGE_ROWS, total - offset), offset=offset)
+            vectors = np.asarray(page["embeddings"], dtype=np.float32)
+            if vectors.ndim != 2 or not len(vectors):
+                break
+            if embeddings is None:
+                embeddings = np.empty((total, vectors.shape[1]), dtype=np.float32)
+            embeddings[len(documents):len(documents) + len(vectors)] = vectors
+            fingerprint.update("\n".join(page["ids"]).encode() + b"\n")
+            documents.extend(
+                Document(page_content=text or "", metadata=meta or {})
+                for text, meta in zip(page["documents"], page["metadatas"])
+            )
+        if embeddings is None:
+            return None, []
+        # Fewer rows than counted if the collection shrank while it was being read
+        return embeddings[:len(documents)], documents
+
+    def search(self, query_embedding, k: int = 3) -> list[Document]:
+        """
+        Return the `k` documents nearest to `query_embedding`, closest first.
+        """
+        return self.search_many([query_embedding], k)
+
+    def search_many(self, query_embeddings, k: int = 3) -> list[Document]:
+        """
+        Return the `k` documents nearest to any of `query_embeddings`, closest first. All
+        queries are searched in one batched call and each document is ranked by its best
+        score across them, so a document matching several queries is returned once.
+        """
+        k = min(k, len(self.documents))
+        if k <= 0:
+            return []
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        if self.matrix is None:
+            labels, distances = self.index.knn_query(queries, k=k)
+            best: dict[int, float] = {}
+            for label, distance in zip(labels.ravel().tolist(), distances.ravel().tolist()):
+                if distance < best.get(label, np.inf):
+                    best[label] = distance
+            return [self.documents[i] for i in sorted(best, key=best.get)[:k]]
+
+        queries = _normalize_rows(queries)
+        if self.scales is None:
+            sims = (self.matrix @ queries.T).max(axis=1)
+        elif simsimd is not None:
+            # SIMD int8 cosine straight on the quantized rows; cosine ignores the per-row scales
+            queries_q = _quantize_rows(queries)[0]
+            distances = np.asarray(simsimd.cdist(queries_q, self.matrix, metric="cosine"), dtype=np.float32)
+            sims = 1.0 - distances.min(axis=0)
+        else:
+            # Each query's scale is put back so scores stay comparable across queries
+            queries_q, query_scales = _quantize_rows(queries)
+            queries_q = queries_q.astype(np.int32).T
+            sims = np.empty(len(self.matrix), dtype=np.float32)
+            for start in range(0, len(self.matrix), INT8_SCORE_BLOCK_ROWS):
+                block = slice(start, start + INT8_SCORE_BLOCK_ROWS)
+                sims[block] = ((self.matrix[block].astype(np.int32) @ queries_q) * query_scales).max(axis=1) * self.scales[block]
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top])]
+        return [self.documents[i] for i in top]
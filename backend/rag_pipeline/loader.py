@@ -1,68 +1,150 @@
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-import json
+from typing import Iterable, Iterator
+import multiprocessing
+import os
+import pickle
+import orjson
 import pandas as pd
 from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 
-def load_mitre_documents(json_path: str) -> list[Document]:
-    with open(json_path, "r", encoding="utf-8") as f:
-        stix_data = json.load(f)
+# Processes parsing files in parallel; parsing a PDF is CPU-bound pure Python
+LOAD_DOC_WORKERS = int(os.getenv("LOAD_DOC_WORKERS", str(max(1, (os.cpu_count() or 1) - 1))))
+# Where parsed MITRE ATT&CK bundles are cached between rebuilds
+MITRE_CACHE_DIR = os.getenv("MITRE_CACHE_DIR", os.path.join("cache", "mitre"))
+
+_MITRE_DOCUMENT_TEMPLATE = (
+    "Name: {}\nID: {}\nDescription: {}\nPlatforms: {}\nKill Chain Phases: {}\nTactic Types: {}"
+).format
+
+def _mitre_cache_path(json_path: str) -> str:
+    return os.path.join(MITRE_CACHE_DIR, Path(json_path).name + ".docs.pkl")
+
+def _parse_mitre_documents(json_path: str) -> list[Document]:
+    stix_data = orjson.loads(Path(json_path).read_bytes())
 
     documents = []
     for obj in stix_data.get("objects", []):
         if obj.get("type") == "attack-pattern" and not obj.get("revoked", False):
-            technique_id = next(
-                (x.get("external_id") for x in obj.get("external_references", []) if "external_id" in x),
-                None
+            technique_id = None
+            for ref in obj.get("external_references", []):
+                if "external_id" in ref:
+                    technique_id = ref.get("external_id")
+                    break
+            phases = obj.get("kill_chain_phases")
+            tactic_types = obj.get("x_mitre_tactic_type")
+            content = _MITRE_DOCUMENT_TEMPLATE(
+                obj.get("name"),
+                technique_id,
+                obj.get("description"),
+                ", ".join(obj.get("x_mitre_platforms", [])),
+                ", ".join([phase["phase_name"] for phase in phases]) if phases else "N/A",
+                ", ".join(tactic_types) if tactic_types else "N/A",
             )
-            content = f"""
-Name: {obj.get('name')}
-ID: {technique_id}
-Description: {obj.get('description')}
-Platforms: {", ".join(obj.get("x_mitre_platforms", []))}
-Kill Chain Phases: {", ".join(x['phase_name'] for x in obj.get('kill_chain_phases', [])) if obj.get('kill_chain_phases') else "N/A"}
-Tactic Types: {", ".join(obj.get("x_mitre_tactic_type", [])) if obj.get("x_mitre_tactic_type") else "N/A"}
-""".strip()
             documents.append(Document(page_content=content, metadata={
                 "source": "MITRE ATT&CK",
                 "technique_id": technique_id
             }))
     return documents
 
+def load_mitre_documents(json_path: str) -> list[Document]:
+    """
+    Attack-pattern documents from a MITRE ATT&CK STIX bundle. The parsed list is pickled under
+    MITRE_CACHE_DIR, stamped with the bundle's path, mtime and size, so later rebuilds skip
+    parsing the multi-MB bundle until it changes.
+    """
+    st = os.stat(json_path)
+    stamp = (os.path.abspath(json_path), st.st_mtime_ns, st.st_size)
+    cache_path = _mitre_cache_path(json_path)
+    try:
+        with open(cache_path, "rb") as f:
+            cached_stamp, documents = pickle.load(f)
+        if cached_stamp == stamp:
+            return documents
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError, ValueError, TypeError):
+        pass
+
+    documents = _parse_mitre_documents(json_path)
+    try:
+        os.makedirs(MITRE_CACHE_DIR, exist_ok=True)
+        # Pickle to a temp file and swap it in, so parallel loaders never read a torn cache
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((stamp, documents), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"[WARN] Could not cache parsed {Path(json_path).name}: {e}")
+    return documents
+
 def load_excel(file_path: Path) -> list[Document]:
     df = pd.read_excel(file_path)
-    documents = []
-    for i, row in df.iterrows():
-        row_text = "\n".join([f"{col}: {row[col]}" for col in df.columns if pd.notnull(row[col])])
-        metadata = {"source": str(file_path.name), "row_index": i}
-        documents.append(Document(page_content=row_text, metadata=metadata))
-    return documents
+    # Work on the raw cell and null-mask arrays rather than boxing every row as a Series
+    prefixes = [f"{col}: " for col in df.columns]
+    values = df.to_numpy(dtype=object)
+    present = df.notna().to_numpy()
+    source = str(file_path.name)
+    return [
+        Document(
+            page_content="\n".join([prefix + str(value) for prefix, value, keep in zip(prefixes, row, mask) if keep]),
+            metadata={"source": source, "row_index": i},
+        )
+        for i, row, mask in zip(df.index.tolist(), values, present)
+    ]
 
-def load_documents(folder_path: str) -> list[Document]:
-    documents = []
-    folder = Path(folder_path)
+def _load_one(file_path: Path) -> list[Document]:
+    suffix = file_path.suffix.lower()
+    try:
+        if suffix == ".pdf":
+            loader = PyPDFLoader(str(file_path))
+            return loader.load()
 
-    for file_path in folder.iterdir():
-        suffix = file_path.suffix.lower()
-        try:
-            if suffix == ".pdf":
-                loader = PyPDFLoader(str(file_path))
-                documents.extend(loader.load())
+        elif suffix == ".xlsx":
+            return load_excel(file_path)
 
-            elif suffix == ".xlsx":
-                documents.extend(load_excel(file_path))
+        elif suffix == ".json" and "attack" in file_path.name.lower():
+            return load_mitre_documents(str(file_path))
 
-            elif suffix == ".json" and "attack" in file_path.name.lower():
-                documents.extend(load_mitre_documents(str(file_path)))
+        else:
+            print(f"[INFO] Ignored unsupported file: {file_path.name}")
+    except Exception as e:
+        print(f"[WARN] Error processing {file_path.name}: {e}")
+    return []
 
-            else:
-                print(f"[INFO] Ignored unsupported file: {file_path.name}")
-        except Exception as e:
-            print(f"[WARN] Error processing {file_path.name}: {e}")
+def iter_documents(folder_path: str) -> Iterator[Document]:
+    """
+    Documents from every supported file in `folder_path`, yielded file by file (in directory
+    order) as each one is parsed, so chunking and embedding can start on the first files
+    while the pool is still parsing the rest. With a pool, parsing starts as soon as this is
+    called rather than on the first `next()`.
+    """
+    paths = list(Path(folder_path).iterdir())
+    workers = min(LOAD_DOC_WORKERS, len(paths))
+    if workers <= 1:
+        return (doc for docs in map(_load_one, paths) for doc in docs)
 
-    return documents
+    # spawn, not fork: the API calls this from a thread while other threads load models
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    futures = [pool.submit(_load_one, path) for path in paths]
+
+    def results() -> Iterator[Document]:
+        try:
+            for future in futures:
+                yield from future.result()
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+    return results()
+
+def load_documents(folder_path: str) -> list[Document]:
+    return list(iter_documents(folder_path))
 
-def chunk_documents(docs: list[Document]) -> list[Document]:
+def chunk_documents(docs: Iterable[Document]) -> Iterator[Document]:
+    """
+    Lazily split `docs` into chunks, one document at a time, so the full chunk list never has
+    to exist alongside the documents.
+    """
     splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    return splitter.split_documents(docs)
\ No newline at end of file
+    for doc in docs:
+        yield from splitter.split_documents([doc])
\ No newline at end of file
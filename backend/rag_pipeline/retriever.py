@@ -1,24 +1,213 @@
 from langchain.chains import RetrievalQA
 from langchain_community.llms import HuggingFacePipeline
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+from langchain_core.prompts import format_document
+from transformers import AutoTokenizer, AutoModelForCausalLM, TextIteratorStreamer, pipeline
+from functools import lru_cache
+from typing import Iterator
+import logging
+import os
+import threading
 import torch
 
-def build_rag_chain(vectordb):
-    retriever = vectordb.as_retriever()
+from rag_pipeline.cpu import int8_cpu_target
+
+logger = logging.getLogger(__name__)
+
+LLM_MODEL_ID = "tiiuae/falcon-rw-1b"  # Local, free, small model
+# "torch" (default) or "onnx-int8": export the model to ONNX, quantize it dynamically to int8
+# and run it with onnxruntime on the CPU
+LLM_BACKEND = os.getenv("LLM_BACKEND", "torch").lower()
+# Where the quantized export is written on first start and reloaded from afterwards; by default
+# one directory per CPU int8 target, since each export is quantized for its target's kernels
+LLM_ONNX_DIR = os.getenv("LLM_ONNX_DIR")
+LLM_ONNX_FILE = "model_quantized.onnx"
+# Intra-op threads for CPU generation; defaults to every core this process may run on
+# (which, unlike os.cpu_count(), respects a container's CPU set)
+_AVAILABLE_CPUS = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", str(_AVAILABLE_CPUS)))
+# Compile the torch model's forward pass with torch.compile (fused kernels). Off by default:
+# compiling adds tens of seconds to startup, which only pays off on long-running servers
+LLM_TORCH_COMPILE = os.getenv("LLM_TORCH_COMPILE", "0") == "1"
+# Prompts the pipeline pads into one generate call; matches the API's micro-batch size
+LLM_GENERATION_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "8"))
+
+@lru_cache(maxsize=None)
+def load_llm_tokenizer():
+    """
+    The LLM's tokenizer, loaded once and shared by the chain and by prompt budgeting.
+    """
+    tokenizer = AutoTokenizer.from_pretrained(LLM_MODEL_ID, use_fast=True)
+    # Falcon ships without a pad token, which batched generation needs; pad on the left so
+    # every prompt in a batch ends right where its generated tokens start
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "left"
+    return tokenizer
+
+def _json_schema_constraint(tokenizer, json_schema: dict):
+    """
+    Build a `prefix_allowed_tokens_fn` that only lets `generate` emit tokens keeping the
+    output a valid prefix of a JSON document matching `json_schema`.
+    """
+    from lmformatenforcer import JsonSchemaParser
+    from lmformatenforcer.integrations.transformers import build_transformers_prefix_allowed_tokens_fn
+
+    return build_transformers_prefix_allowed_tokens_fn(tokenizer, JsonSchemaParser(json_schema))
+
+def _int8_quantization_config(target: str):
+    """
+    Dynamic int8 quantization config for a CPU target from `int8_cpu_target`. Without VNNI the
+    u8 x s8 multiply-adds can saturate their 16-bit intermediates, so the AVX2 and AVX-512
+    configs quantize weights to 7 bits (reduce_range).
+    """
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    if target == "arm64":
+        return AutoQuantizationConfig.arm64(is_static=False, per_channel=False)
+    if target == "avx512_vnni":
+        return AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+    if target == "avx512":
+        return AutoQuantizationConfig.avx512(is_static=False, per_channel=False, reduce_range=True)
+    return AutoQuantizationConfig.avx2(is_static=False, per_channel=False, reduce_range=True)
+
+def _load_onnx_int8_model():
+    from optimum.onnxruntime import ORTModelForCausalLM, ORTQuantizer
+
+    target = int8_cpu_target()
+    onnx_dir = LLM_ONNX_DIR or os.path.join("cache", f"falcon-rw-1b-onnx-int8-{target}")
+    if not os.path.exists(os.path.join(onnx_dir, LLM_ONNX_FILE)):
+        logger.info(f"Exporting {LLM_MODEL_ID} to ONNX and quantizing it to int8 for {target} in {onnx_dir}")
+        model = ORTModelForCausalLM.from_pretrained(LLM_MODEL_ID, export=True)
+        ORTQuantizer.from_pretrained(model).quantize(save_dir=onnx_dir, quantization_config=_int8_quantization_config(target))
+        model.config.save_pretrained(onnx_dir)
+    return ORTModelForCausalLM.from_pretrained(onnx_dir, file_name=LLM_ONNX_FILE, provider="CPUExecutionProvider")
+
+@lru_cache(maxsize=None)
+def load_llm_model():
+    """
+    The generation model and the pipeline device it belongs on, loaded once per process so
+    every chain built here shares one copy of the weights.
+    """
+    if LLM_BACKEND == "onnx-int8":
+        return _load_onnx_int8_model(), -1
+    if torch.cuda.is_available():
+        # Half precision on GPU: half the memory traffic per token and tensor-core matmuls
+        dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+        device = 0
+    else:
+        dtype = torch.float32
+        device = -1
+        _set_cpu_threads()
+    model = AutoModelForCausalLM.from_pretrained(LLM_MODEL_ID, torch_dtype=dtype)
+    if LLM_TORCH_COMPILE:
+        _compile_model(model, device)
+    return model, device
+
+def _set_cpu_threads() -> None:
+    torch.set_num_threads(TORCH_NUM_THREADS)
+    try:
+        # Generation is one sequential op graph; inter-op threads would only oversubscribe cores
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # can only be set before the first inter-op parallel work in the process
+    logger.info(f"Running the LLM on the CPU with {TORCH_NUM_THREADS} threads")
 
-    model_id = "tiiuae/falcon-rw-1b"  # Local, free, small model
-    tokenizer = AutoTokenizer.from_pretrained(model_id)
-    model = AutoModelForCausalLM.from_pretrained(model_id)
+def _compile_model(model, device: int) -> None:
+    """
+    Swap in a compiled forward pass and run one short generation, so the compilation happens
+    at startup rather than on the first request. `dynamic=True` keeps the varying prompt
+    lengths and the prefill/decode steps from each triggering a recompile.
+    """
+    model.to("cuda" if device >= 0 else "cpu")
+    model.forward = torch.compile(model.forward, dynamic=True)
+    inputs = load_llm_tokenizer()("Warm up", return_tensors="pt").to(model.device)
+    with torch.inference_mode():
+        model.generate(**inputs, max_new_tokens=2, do_sample=False)
+    logger.info("Compiled the LLM forward pass with torch.compile")
+
+def load_llm(json_schema: dict | None = None):
+    """
+    Wrap the generation model in a LangChain LLM. If `json_schema` is given, generation is
+    grammar-constrained so the model's answer is always a JSON object matching it.
+    """
+    tokenizer = load_llm_tokenizer()
+    model, device = load_llm_model()
+
+    generate_kwargs = {}
+    if json_schema is not None:
+        generate_kwargs["prefix_allowed_tokens_fn"] = _json_schema_constraint(tokenizer, json_schema)
 
     pipe = pipeline(
         "text-generation",
         model=model,
         tokenizer=tokenizer,
-        device=0 if torch.cuda.is_available() else -1,
+        device=device,
+        # LangChain passes prompts as a list, which the pipeline feeds through a DataLoader;
+        # keep that in-process rather than starting loader workers per call
+        num_workers=0,
+        batch_size=LLM_GENERATION_BATCH_SIZE,
+        # Return only the generated text; by default the pipeline prepends the prompt, whose
+        # JSON template would then be parsed as the answer
+        return_full_text=False,
         max_new_tokens=256,
         do_sample=True,
         temperature=0.7,
+        **generate_kwargs,
     )
 
-    llm = HuggingFacePipeline(pipeline=pipe)
-    return RetrievalQA.from_chain_type(llm=llm, retriever=retriever, return_source_documents=True)
\ No newline at end of file
+    return HuggingFacePipeline(pipeline=pipe, batch_size=LLM_GENERATION_BATCH_SIZE)
+
+def build_rag_chain(vectordb, json_schema: dict | None = None):
+    """
+    Build the RetrievalQA chain over `vectordb` for the interactive CLI. The API retrieves from
+    its in-memory index itself and sends the finished prompts to `agenerate_answers`.
+    """
+    retriever = vectordb.as_retriever()
+    llm = load_llm(json_schema)
+    return RetrievalQA.from_chain_type(llm=llm, retriever=retriever, return_source_documents=True)
+
+def _stuff_prompt(qa_chain, query: str, docs: list) -> str:
+    """The prompt a chain from `build_rag_chain` sends its LLM for `query` and retrieved `docs`."""
+    stuff = qa_chain.combine_documents_chain
+    context = stuff.document_separator.join(format_document(doc, stuff.document_prompt) for doc in docs)
+    return stuff.llm_chain.prompt.format(**{stuff.document_variable_name: context, "question": query})
+
+async def agenerate_answers(llm, prompts: list[str]) -> list[str]:
+    """
+    Generate an answer for each of `prompts` with an LLM from `load_llm`. The prompts are sent
+    as-is, with no retrieval step, in one `agenerate` call, so the pipeline pads them into
+    shared batches rather than running one generate call per prompt.
+    """
+    result = await llm.agenerate(prompts)
+    return [generations[0].text for generations in result.generations]
+
+def stream_rag_answer(qa_chain, query: str) -> tuple[Iterator[str], list]:
+    """
+    Answer `query` with a chain from `build_rag_chain`, but hand back the generated text as it
+    is decoded rather than after the last token. Returns `(chunks, source_documents)`;
+    generation runs in a background thread and iterating `chunks` drains it.
+    """
+    docs = qa_chain.retriever.invoke(query)
+    stuff = qa_chain.combine_documents_chain
+    prompt = _stuff_prompt(qa_chain, query, docs)
+
+    streamer = TextIteratorStreamer(load_llm_tokenizer(), skip_prompt=True, skip_special_tokens=True)
+    errors = []
+
+    def generate():
+        try:
+            stuff.llm_chain.llm.invoke(prompt, pipeline_kwargs={"streamer": streamer})
+        except BaseException as e:
+            errors.append(e)
+            streamer.end()  # unblock the reader
+
+    thread = threading.Thread(target=generate, name="llm-stream", daemon=True)
+    thread.start()
+
+    def chunks():
+        yield from streamer
+        thread.join()
+        if errors:
+            raise errors[0]
+
+    return chunks(), docs
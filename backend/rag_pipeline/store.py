@@ -5,23 +5,112 @@
 import logging
 import os
 import shutil
+from itertools import islice
+from typing import Iterable
+import chromadb
+from chromadb.config import Settings
 from langchain_chroma import Chroma
 from langchain.schema import Document
 from rag_pipeline.loader import load_documents, chunk_documents
 
 logger = logging.getLogger(__name__)
 
+# When CHROMA_HOST is set, talk to a Chroma server (`chroma run --path vectordb/`) instead of
+# opening the sqlite store in-process, so concurrent queries don't contend on one connection
+CHROMA_HOST = os.getenv("CHROMA_HOST")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
+# Chunks embedded and written per call while building the store. Each call is one
+# embed_documents pass and one Chroma upsert; larger batches amortise the per-insert
+# sqlite/index overhead. Capped at the client's own max batch size.
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "4096"))
 
-def store_embeddings(chunks: list[Document], embedder, persist_dir: str = "vectordb") -> Chroma:
+_http_client = None
+
+
+def _client_settings(**kwargs) -> Settings:
+    # No anonymized telemetry: otherwise chromadb posts a usage event from inside operations
+    return Settings(anonymized_telemetry=False, **kwargs)
+
+
+def get_chroma_client():
     """
-    Create a new Chroma vector store from document chunks and persist to disk.
+    Return the process-wide Chroma HttpClient (which reuses its HTTP connection pool) when
+    CHROMA_HOST is set, otherwise None for the embedded persistent store.
     """
-    db = Chroma.from_documents(
-        documents=chunks,
-        embedding=embedder,  # ✅ Use 'embedding' instead of 'embedding_function'
-        persist_directory=persist_dir
+    global _http_client
+    if CHROMA_HOST and _http_client is None:
+        _http_client = chromadb.HttpClient(host=CHROMA_HOST, port=CHROMA_PORT, settings=_client_settings())
+    return _http_client
+
+
+def _store_location(persist_dir: str) -> dict:
+    client = get_chroma_client()
+    if client:
+        return {"client": client}
+    # Langchain doesn't mark custom client settings persistent on its own
+    return {
+        "persist_directory": persist_dir,
+        "client_settings": _client_settings(is_persistent=True, persist_directory=persist_dir),
+    }
+
+
+def vector_store_exists(persist_dir: str = "vectordb") -> bool:
+    """
+    Whether there is already an embedded store in `persist_dir`, or a non-empty collection on
+    the Chroma server.
+    """
+    client = get_chroma_client()
+    if client:
+        try:
+            return client.get_collection(Chroma._LANGCHAIN_DEFAULT_COLLECTION_NAME).count() > 0
+        except Exception:
+            return False
+    return os.path.exists(persist_dir) and bool(os.listdir(persist_dir))
+
+
+def prefetch_store(persist_dir: str = "vectordb") -> int:
+    """
+    Ask the kernel to start reading the embedded store's files into the page cache, so the
+    reads overlap with other startup work (e.g. loading the embedding model) instead of
+    happening on first access. No-op for a Chroma server or where posix_fadvise is missing.
+    Returns the number of bytes advised.
+    """
+    if get_chroma_client() or not hasattr(os, "posix_fadvise") or not os.path.isdir(persist_dir):
+        return 0
+    total = 0
+    for root, _, files in os.walk(persist_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+                total += os.fstat(fd).st_size
+            finally:
+                os.close(fd)
+    return total
+
+
+def store_embeddings(chunks: Iterable[Document], embedder, persist_dir: str = "vectordb") -> Chroma:
+    """
+    Create a new Chroma vector store from document chunks. With a persist directory Chroma
+    writes each batch to disk as it is added, so there is no separate persist step. Chunks are
+    embedded and written INGEST_BATCH_SIZE at a time, so `chunks` can be a lazy iterator and
+    only one batch of texts and embeddings is held in memory.
+    """
+    db = Chroma(
+        embedding_function=embedder,
+        **_store_location(persist_dir)
     )
-    db.persist()
+    batch_size = INGEST_BATCH_SIZE
+    get_max_batch_size = getattr(db._client, "get_max_batch_size", None)
+    if get_max_batch_size is not None:
+        batch_size = min(batch_size, get_max_batch_size())
+    chunks = iter(chunks)
+    while batch := list(islice(chunks, batch_size)):
+        db.add_documents(batch)
     return db
 
 
@@ -32,8 +121,8 @@ def load_existing_embeddings(embedder, persist_dir: str = "vectordb") -> Chroma:
     """
     try:
         return Chroma(
-            persist_directory=persist_dir,
-            embedding_function=embedder
+            embedding_function=embedder,
+            **_store_location(persist_dir)
         )
     except KeyError as e:
         logger.warning(f"Chroma collection load failed: {e}. Rebuilding vector store from source documents.")
@@ -45,11 +134,4 @@ def load_existing_embeddings(embedder, persist_dir: str = "vectordb") -> Chroma:
         docs = load_documents(docs_dir)
         if not docs:
             raise RuntimeError(f"No documents found in {docs_dir} to rebuild embeddings.")
-        chunks = chunk_documents(docs)
-        db = Chroma.from_documents(
-            documents=chunks,
-            embedding_function=embedder,
-            persist_directory=persist_dir
-        )
-        db.persist()
-        return db
\ No newline at end of file
+        return store_embeddings(chunk_documents(docs), embedder, persist_dir=persist_dir)
\ No newline at end of file
@@ -0,0 +1,73 @@
+# session_store.py
+# ------------------
+# Per-session assessment state, shared across uvicorn workers when Redis is configured
+
+import time
+from typing import Dict, Optional, Tuple
+
+DEFAULT_SESSION_TTL_SECONDS = 1800
+DEFAULT_MAX_ENTRIES = 20_000
+
+
+class InMemorySessionStore:
+    """
+    Process-local store. Only safe with a single uvicorn worker.
+
+    Holds at most `max_entries` values; once full, the least recently written one is dropped.
+    """
+
+    def __init__(self, ttl_seconds: int = DEFAULT_SESSION_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # Insertion-ordered, so the first key is always the least recently written
+        self._data: Dict[str, Tuple[float, str]] = {}
+
+    async def get(self, session_id: str, key: str) -> Optional[str]:
+        entry = self._data.get(f"{session_id}:{key}")
+        if not entry:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[f"{session_id}:{key}"]
+            return None
+        return value
+
+    async def set(self, session_id: str, key: str, value: str) -> None:
+        data_key = f"{session_id}:{key}"
+        self._data.pop(data_key, None)
+        while len(self._data) >= self.max_entries:
+            del self._data[next(iter(self._data))]
+        self._data[data_key] = (time.monotonic() + self.ttl_seconds, value)
+
+    async def close(self) -> None:
+        self._data.clear()
+
+
+class RedisSessionStore:
+    """
+    Redis-backed store; values are kept under `sess:<session_id>:<key>` with a TTL.
+    """
+
+    def __init__(self, url: str, ttl_seconds: int = DEFAULT_SESSION_TTL_SECONDS):
+        import redis.asyncio as aioredis
+
+        self.ttl_seconds = ttl_seconds
+        self._redis = aioredis.from_url(url, decode_responses=True)
+
+    async def get(self, session_id: str, key: str) -> Optional[str]:
+        return await self._redis.get(f"sess:{session_id}:{key}")
+
+    async def set(self, session_id: str, key: str, value: str) -> None:
+        await self._redis.set(f"sess:{session_id}:{key}", value, ex=self.ttl_seconds)
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+def create_session_store(redis_url: Optional[str] = None, ttl_seconds: int = DEFAULT_SESSION_TTL_SECONDS):
+    """
+    Return a Redis-backed store when `redis_url` is set, otherwise an in-memory one.
+    """
+    if redis_url:
+        return RedisSessionStore(redis_url, ttl_seconds=ttl_seconds)
+    return InMemorySessionStore(ttl_seconds=ttl_seconds)
@@ -0,0 +1,8 @@
+# tests/conftest.py
+# ------------------
+# Make the backend modules importable the same way the app imports them (`rag_pipeline.*`)
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,287 @@
+import asyncio
+
+import orjson
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+from api import ADVICE_PROMPT_FOOTER, ADVICE_PROMPT_HEADER, extract_json_object
+from session_store import InMemorySessionStore
+
+ADVICE = {
+    "recommendations": ["Enforce MFA {everywhere}", "Patch monthly"],
+    "resources": [{"title": "NIST CSF", "url": "https://www.nist.gov/cyberframework"}],
+    "rawLLMOutput": "Weakest areas were identity and patching.",
+}
+PROFILE = api.CompanyProfile(
+    industry="Finance", size="Medium", tech_adoption="High", security_controls="MFA on email",
+    risk_posture="Moderate", emerging_technologies=["AI/ML"],
+)
+
+
+def advice_prompt(context="Some retrieved context."):
+    return ADVICE_PROMPT_HEADER + "Industry: Finance" + api.ADVICE_PROMPT_CONTEXT_HEADER + context + ADVICE_PROMPT_FOOTER
+
+
+def test_extract_json_object_handles_braces_in_strings_and_trailing_prose():
+    output = "Sure, here it is: " + orjson.dumps(ADVICE).decode() + "\nHope that helps {:}"
+    assert orjson.loads(extract_json_object(output)) == ADVICE
+
+
+def test_extract_json_object_skips_the_template_in_an_echoed_prompt():
+    prompt = advice_prompt()
+    # The header's JSON template is itself valid JSON, so a scan from the start would return it
+    assert orjson.loads(extract_json_object(prompt)).keys() == ADVICE.keys()
+
+    output = prompt + "\nHelpful Answer: " + orjson.dumps(ADVICE).decode()
+    assert orjson.loads(extract_json_object(output, ADVICE_PROMPT_FOOTER)) == ADVICE
+
+
+def test_extract_json_object_finds_nothing_in_a_prompt_without_an_answer():
+    assert extract_json_object(advice_prompt() + "\nHelpful Answer: I cannot help.", ADVICE_PROMPT_FOOTER) is None
+
+
+def test_extract_json_object_falls_back_to_balanced_braces_then_last_brace():
+    assert extract_json_object('x {"a": [1, 2}} y') == '{"a": [1, 2}'
+    assert extract_json_object('{"a": {"b": 1}') == '{"a": {"b": 1}'
+    assert extract_json_object("no json here") is None
+
+
+class StubCache:
+    def __init__(self, output):
+        self.output = output
+        self.keys = []
+
+    async def get_or_compute(self, text, compute, bucket=""):
+        self.keys.append((bucket, text))
+        return self.output
+
+
+def generate_advice(monkeypatch, output, guided):
+    monkeypatch.setattr(api, "llm", object())
+    monkeypatch.setattr(api, "llm_cache", StubCache(output))
+    monkeypatch.setattr(api, "LLM_GUIDED_JSON", guided)
+    return asyncio.run(api.generate_llm_advice_async(PROFILE, {}, []))
+
+
+def test_guided_advice_is_parsed_as_is(monkeypatch):
+    recommendations, resources, raw = generate_advice(monkeypatch, orjson.dumps(ADVICE).decode(), guided=True)
+    assert (recommendations, resources, raw) == (ADVICE["recommendations"], ADVICE["resources"], ADVICE["rawLLMOutput"])
+
+
+def test_unguided_advice_is_extracted_from_prose(monkeypatch):
+    output = "Here is my advice:\n" + orjson.dumps(ADVICE).decode() + "\nGood luck!"
+    recommendations, resources, _ = generate_advice(monkeypatch, output, guided=False)
+    assert (recommendations, resources) == (ADVICE["recommendations"], ADVICE["resources"])
+
+
+def test_unparseable_advice_falls_back_to_the_defaults(monkeypatch):
+    recommendations, resources, raw = generate_advice(monkeypatch, "I cannot help with that.", guided=False)
+    assert recommendations == ["LLM did not return a JSON object. Storing raw output."]
+    assert resources == api.DEFAULT_RESOURCES
+    assert raw == "I cannot help with that."
+
+
+def risk_rows(*scores):
+    return [
+        api.RiskTableRow(id=f"cat{i}", category=f"Category {i}", definition="", scoring_focus="", score=score, max_score=10, weight=0.1, explanation="")
+        for i, score in enumerate(scores)
+    ]
+
+
+def test_advice_cache_bucket_separates_profiles_and_weakest_scores():
+    answers = {"cat0": "We have no MFA.", "cat1": "Patching is ad hoc."}
+    bucket, text = api.build_advice_cache_key(PROFILE, answers, risk_rows(2, 3, 4, 9))
+    assert "We have no MFA." in text and "MFA on email" in text
+
+    other_industry = PROFILE.model_copy(update={"industry": "Healthcare"})
+    other_size = PROFILE.model_copy(update={"size": "Small"})
+    for profile, rows in ((other_industry, risk_rows(2, 3, 4, 9)), (other_size, risk_rows(2, 3, 4, 9)), (PROFILE, risk_rows(2, 3, 5, 9))):
+        assert api.build_advice_cache_key(profile, answers, rows)[0] != bucket
+    # Only the weakest three categories are part of the key
+    assert api.build_advice_cache_key(PROFILE, answers, risk_rows(2, 3, 4, 8))[0] == bucket
+
+
+def test_advice_is_looked_up_in_the_submission_bucket(monkeypatch):
+    generate_advice(monkeypatch, orjson.dumps(ADVICE).decode(), guided=True)
+    [(bucket, text)] = api.llm_cache.keys
+    assert (bucket, text) == api.build_advice_cache_key(PROFILE, {}, [])
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(api, "llm", object())
+    monkeypatch.setattr(api, "session_store", InMemorySessionStore())
+    # No lifespan: the models and the store are never loaded
+    return TestClient(api.app)
+
+
+def start_session(client, monkeypatch):
+    async def embed(text):
+        return [0.1, 0.2, 0.3]
+
+    monkeypatch.setattr(api, "embed_async", embed)
+    response = client.post("/initialize-assessment", json=PROFILE.model_dump())
+    assert response.status_code == 200
+    return response.headers[api.SESSION_HEADER]
+
+
+def stream_events(client, session_id, answers=()):
+    response = client.post(
+        "/submit-answers/stream",
+        json={"answers": [{"question_id": q, "answer": a} for q, a in answers]},
+        headers={api.SESSION_HEADER: session_id},
+    )
+    assert response.status_code == 200
+    events = []
+    for block in response.text.split("\n\n"):
+        if block.startswith("event: "):
+            name, data = block.split("\n", 1)
+            events.append((name[len("event: "):], orjson.loads(data[len("data: "):])))
+    return events
+
+
+def stub_advice(monkeypatch, resources=ADVICE["resources"]):
+    async def generate(profile, answers, risk_table, profile_embedding=None):
+        return ADVICE["recommendations"], resources, ADVICE["rawLLMOutput"]
+
+    monkeypatch.setattr(api, "generate_llm_advice_async", generate)
+
+
+def test_stream_sends_the_assessment_then_the_advice(client, monkeypatch):
+    stub_advice(monkeypatch)
+    session_id = start_session(client, monkeypatch)
+
+    events = stream_events(client, session_id, [("cloud_security", "Strong, fully implemented controls.")])
+    assert [name for name, _ in events] == ["assessment", "advice"]
+    assessment, advice = events[0][1], events[1][1]
+    assert set(assessment) == {"overall_weighted_score", "risk_table", "data_insights"}
+    assert len(assessment["risk_table"]) == len(api.RISK_CATEGORIES_DEFINITION)
+    assert advice == {
+        "recommendations": ADVICE["recommendations"],
+        "resources": ADVICE["resources"],
+        "raw_llm_output": ADVICE["rawLLMOutput"],
+    }
+
+
+def test_stream_reports_a_scoring_failure_as_an_error_event(client, monkeypatch):
+    stub_advice(monkeypatch)
+    session_id = start_session(client, monkeypatch)
+
+    def fail(profile, answers):
+        raise ValueError("scoring broke")
+
+    monkeypatch.setattr(api, "build_risk_table", fail)
+    events = stream_events(client, session_id)
+    assert [name for name, _ in events] == ["error"]
+    assert "scoring broke" in events[0][1]["detail"]
+
+
+def test_stream_reports_a_malformed_session_embedding_as_an_error_event(client, monkeypatch):
+    stub_advice(monkeypatch)
+    session_id = start_session(client, monkeypatch)
+    asyncio.run(api.session_store.set(session_id, "profile_embedding", "not json"))
+
+    assert [name for name, _ in stream_events(client, session_id)] == ["error"]
+
+
+def test_stream_validates_the_advice_resources(client, monkeypatch):
+    stub_advice(monkeypatch, resources=["https://example.com"])
+    session_id = start_session(client, monkeypatch)
+
+    assert [name for name, _ in stream_events(client, session_id)] == ["assessment", "error"]
+
+
+POSITIVE_KEYWORDS = ["strong", "comprehensive", "fully implemented", "excellent", "robust",
+                     "mature", "advanced", "complete", "thorough", "effective"]
+NEGATIVE_KEYWORDS = ["weak", "lacking", "not implemented", "poor", "minimal",
+                     "immature", "basic", "incomplete", "inadequate", "ineffective"]
+
+
+def baseline_risk_table(answers):
+    """The original per-category scoring loop, kept as the reference the kernels must match."""
+    scores, weighted, weights = [], 0.0, 0.0
+    for cat in api.RISK_CATEGORIES_DEFINITION:
+        text = answers.get(cat.id, "No answer provided")
+        if text.lower() == "no answer provided":
+            score = 2
+        elif len(text) < 20:
+            score = 4
+        elif len(text) < 100:
+            score = 6
+        else:
+            score = 8
+        if any(kw in text.lower() for kw in POSITIVE_KEYWORDS):
+            score = min(cat.max_score, score + 2)
+        elif any(kw in text.lower() for kw in NEGATIVE_KEYWORDS):
+            score = max(0, score - 2)
+        score = max(0, min(cat.max_score, score))
+        scores.append(score)
+        weighted += score * cat.weight
+        weights += cat.weight
+    return scores, round(weighted / (10 * weights) * 100, 2)
+
+
+SAMPLE_ANSWERS = [
+    "No Answer Provided",
+    "",
+    "x" * 19,
+    "x" * 20,
+    "y" * 99,
+    "z" * 100,
+    "STRONG",
+    "Our controls are robust but incomplete in places.",
+    "MFA is not implemented anywhere yet.",
+    "Basic. " * 30,
+    "We take a thorough, fully implemented approach to logging and detection across all systems",
+]
+
+
+@pytest.mark.parametrize("kernel", [api._score_answers_numpy, api._score_answers_loop])
+@pytest.mark.parametrize("offset", range(len(SAMPLE_ANSWERS)))
+def test_risk_table_scores_match_the_baseline(monkeypatch, kernel, offset):
+    monkeypatch.setattr(api, "score_answers", kernel)
+    categories = api.RISK_CATEGORIES_DEFINITION
+    # Rotate the samples across categories, leaving the last one unanswered
+    answers = {cat.id: SAMPLE_ANSWERS[(i + offset) % len(SAMPLE_ANSWERS)] for i, cat in enumerate(categories[:-1])}
+
+    table, overall, insights = api.build_risk_table(PROFILE, answers)
+    expected_scores, expected_overall = baseline_risk_table(answers)
+    assert [row.score for row in table] == expected_scores
+    assert overall == expected_overall
+    assert [row.id for row in table] == [cat.id for cat in categories]
+    assert len(insights) == len(categories)
+
+
+def test_compiled_scoring_kernel_matches_the_baseline():
+    # With numba installed this is the njit-compiled loop, otherwise the NumPy kernel
+    answers = {cat.id: SAMPLE_ANSWERS[i % len(SAMPLE_ANSWERS)] for i, cat in enumerate(api.RISK_CATEGORIES_DEFINITION)}
+    table, overall, _ = api.build_risk_table(PROFILE, answers)
+    assert ([row.score for row in table], overall) == baseline_risk_table(answers)
+
+
+def test_initialize_issues_a_fresh_session_id(client, monkeypatch):
+    first = start_session(client, monkeypatch)
+    second = start_session(client, monkeypatch)
+    assert first and second and first != second
+
+
+def test_initialize_never_adopts_an_unknown_session_id(client, monkeypatch):
+    start_session(client, monkeypatch)
+    response = client.post("/initialize-assessment", json=PROFILE.model_dump(), headers={api.SESSION_HEADER: "planted-id"})
+    assert response.status_code == 200
+    assert response.headers[api.SESSION_HEADER] != "planted-id"
+    assert asyncio.run(api.session_store.get("planted-id", "profile")) is None
+
+
+def test_initialize_reuses_a_live_session_id(client, monkeypatch):
+    session_id = start_session(client, monkeypatch)
+    updated = PROFILE.model_copy(update={"industry": "Healthcare"})
+    response = client.post("/initialize-assessment", json=updated.model_dump(), headers={api.SESSION_HEADER: session_id})
+    assert response.headers[api.SESSION_HEADER] == session_id
+    assert asyncio.run(api.load_session_profile(session_id)).industry == "Healthcare"
+
+
+def test_submit_without_an_initialized_session_is_rejected(client):
+    response = client.post("/submit-answers/stream", json={"answers": []}, headers={api.SESSION_HEADER: "unknown"})
+    assert response.status_code == 400
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from rag_pipeline.batching import MicroBatcher
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_results_go_back_to_their_callers_in_bounded_batches():
+    sizes = []
+
+    async def double(items):
+        sizes.append(len(items))
+        return [item * 2 for item in items]
+
+    async def main():
+        batcher = MicroBatcher(double, max_batch_size=4, max_wait_ms=5)
+        batcher.start()
+        try:
+            return await asyncio.gather(*(batcher.submit(i) for i in range(10)))
+        finally:
+            await batcher.stop()
+
+    assert run(main()) == [i * 2 for i in range(10)]
+    assert max(sizes) <= 4
+    assert sum(sizes) == 10
+
+
+def test_submit_before_start_fails():
+    async def main():
+        batcher = MicroBatcher(lambda items: items)
+        with pytest.raises(RuntimeError):
+            await batcher.submit(1)
+
+    run(main())
+
+
+@pytest.mark.parametrize("max_concurrency", [1, 3])
+def test_at_most_max_concurrency_batches_run_at_once(max_concurrency):
+    running = peak = 0
+
+    async def slow(items):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+        return items
+
+    async def main():
+        batcher = MicroBatcher(slow, max_batch_size=2, max_wait_ms=1, max_concurrency=max_concurrency)
+        batcher.start()
+        try:
+            return await asyncio.gather(*(batcher.submit(i) for i in range(12)))
+        finally:
+            await batcher.stop()
+
+    assert run(main()) == list(range(12))
+    assert peak == max_concurrency
+
+
+def test_failed_batch_fails_its_callers_and_frees_its_slot():
+    calls = 0
+
+    async def flaky(items):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise ValueError("boom")
+        return items
+
+    async def main():
+        batcher = MicroBatcher(flaky, max_batch_size=8, max_wait_ms=1, max_concurrency=1)
+        batcher.start()
+        try:
+            with pytest.raises(ValueError):
+                await batcher.submit("first")
+            # With the only slot leaked this would hang
+            return await asyncio.wait_for(batcher.submit("second"), timeout=1)
+        finally:
+            await batcher.stop()
+
+    assert run(main()) == "second"
+
+
+def test_stop_fails_in_flight_and_queued_callers():
+    async def never(items):
+        await asyncio.sleep(10)
+        return items
+
+    async def main():
+        batcher = MicroBatcher(never, max_batch_size=1, max_wait_ms=1, max_concurrency=1)
+        batcher.start()
+        in_flight = asyncio.ensure_future(batcher.submit("a"))
+        queued = asyncio.ensure_future(batcher.submit("b"))
+        await asyncio.sleep(0.02)
+        await batcher.stop()
+        for fut in (in_flight, queued):
+            with pytest.raises(RuntimeError, match="stopped"):
+                await asyncio.wait_for(fut, timeout=1)
+
+    run(main())
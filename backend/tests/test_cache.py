@@ -0,0 +1,202 @@
+import asyncio
+import hashlib
+
+import numpy as np
+import pytest
+
+from rag_pipeline import cache as cache_module
+from rag_pipeline.cache import SemanticCache, normalize_prompt
+
+
+class StubEmbedder:
+    """Deterministic random vector per text; texts in `aliases` embed like their target."""
+
+    def __init__(self, aliases=None, dim=16):
+        self.aliases = aliases or {}
+        self.dim = dim
+
+    def embed_query(self, text):
+        text = self.aliases.get(text, text)
+        seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+        return np.random.default_rng(seed).normal(size=self.dim).tolist()
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "time", clock.time)
+    return clock
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def counting_compute():
+    calls = []
+
+    async def compute(prompt):
+        calls.append(prompt)
+        await asyncio.sleep(0)
+        return f"answer to {prompt}"
+
+    return compute, calls
+
+
+def test_normalize_prompt_collapses_case_and_whitespace():
+    assert normalize_prompt("  Hello \n\t World ") == "hello world"
+
+
+def test_exact_repeat_is_served_from_cache(clock):
+    cache = SemanticCache(StubEmbedder())
+    compute, calls = counting_compute()
+
+    assert run(cache.get_or_compute("Assess  ACME", compute)) == "answer to Assess  ACME"
+    assert run(cache.get_or_compute("assess acme", compute)) == "answer to Assess  ACME"
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_semantically_close_prompt_hits_and_distant_one_misses(clock):
+    cache = SemanticCache(StubEmbedder(aliases={"assess acme corp": "assess acme"}))
+    compute, calls = counting_compute()
+
+    run(cache.get_or_compute("assess acme", compute))
+    assert run(cache.get_or_compute("assess acme corp", compute)) == "answer to assess acme"
+    assert run(cache.get_or_compute("something unrelated", compute)) == "answer to something unrelated"
+    assert calls == ["assess acme", "something unrelated"]
+
+
+def test_concurrent_identical_misses_share_one_computation(clock):
+    cache = SemanticCache(StubEmbedder())
+    compute, calls = counting_compute()
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_compute("same prompt", compute) for _ in range(5)))
+
+    assert run(main()) == ["answer to same prompt"] * 5
+    assert calls == ["same prompt"]
+    assert not cache._inflight
+
+
+def test_cancelled_waiter_does_not_cancel_the_shared_computation(clock):
+    cache = SemanticCache(StubEmbedder())
+
+    async def main():
+        gate = asyncio.Event()
+
+        async def compute(prompt):
+            await gate.wait()
+            return "done"
+
+        first = asyncio.ensure_future(cache.get_or_compute("slow prompt", compute))
+        second = asyncio.ensure_future(cache.get_or_compute("slow prompt", compute))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.sleep(0)
+        gate.set()
+        return await second, first.cancelled()
+
+    assert run(main()) == ("done", True)
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = SemanticCache(StubEmbedder(), ttl_seconds=10)
+    compute, calls = counting_compute()
+
+    run(cache.get_or_compute("prompt", compute))
+    clock.now += 11
+    run(cache.get_or_compute("prompt", compute))
+    assert len(calls) == 2
+
+
+def test_eviction_keeps_keys_and_vectors_in_step(clock):
+    cache = SemanticCache(StubEmbedder(), max_entries=3)
+    compute, _ = counting_compute()
+
+    for i in range(6):
+        clock.now += 1
+        run(cache.get_or_compute(f"prompt {i}", compute))
+
+    assert len(cache._entries) == 3
+    assert len(cache._keys) == len(cache._buckets) == len(cache._vectors) == 3
+    assert set(cache._keys) == set(cache._entries)
+    # The newest entries survive, and each row still matches its own prompt
+    for i in range(3, 6):
+        norm = normalize_prompt(f"prompt {i}")
+        row = cache._keys.index(cache._key(norm))
+        assert np.allclose(cache._vectors[row], cache._embed(norm))
+
+
+def test_save_and_load_round_trip(clock, tmp_path):
+    cache = SemanticCache(StubEmbedder())
+    compute, _ = counting_compute()
+    run(cache.get_or_compute("first prompt", compute))
+    run(cache.get_or_compute("second prompt", compute))
+
+    assert cache.save(str(tmp_path))
+    assert not cache.save(str(tmp_path))  # nothing changed since
+
+    restored = SemanticCache(StubEmbedder())
+    assert restored.load(str(tmp_path)) == 2
+    compute, calls = counting_compute()
+    assert run(restored.get_or_compute("second prompt", compute)) == "answer to second prompt"
+    assert not calls
+
+
+def test_load_skips_expired_entries(clock, tmp_path):
+    cache = SemanticCache(StubEmbedder(), ttl_seconds=10)
+    compute, _ = counting_compute()
+    run(cache.get_or_compute("prompt", compute))
+    cache.save(str(tmp_path))
+
+    clock.now += 11
+    assert SemanticCache(StubEmbedder()).load(str(tmp_path)) == 0
+
+
+def test_clear_drops_everything_and_marks_dirty(clock, tmp_path):
+    cache = SemanticCache(StubEmbedder())
+    compute, calls = counting_compute()
+    run(cache.get_or_compute("prompt", compute))
+    cache.save(str(tmp_path))
+
+    cache.clear()
+    assert cache.save(str(tmp_path))
+    assert SemanticCache(StubEmbedder()).load(str(tmp_path)) == 0
+    run(cache.get_or_compute("prompt", compute))
+    assert len(calls) == 2
+
+
+def test_similar_prompts_in_other_buckets_never_match(clock):
+    cache = SemanticCache(StubEmbedder(aliases={"assess acme corp": "assess acme"}))
+    compute, calls = counting_compute()
+
+    run(cache.get_or_compute("assess acme", compute, bucket="finance"))
+    assert run(cache.get_or_compute("assess acme", compute, bucket="healthcare")) == "answer to assess acme"
+    assert run(cache.get_or_compute("assess acme corp", compute, bucket="healthcare")) == "answer to assess acme"
+    assert run(cache.get_or_compute("assess acme corp", compute, bucket="finance")) == "answer to assess acme"
+    assert calls == ["assess acme", "assess acme"]
+    assert sorted(cache._buckets) == ["finance", "healthcare"]
+
+
+def test_buckets_survive_save_and_load(clock, tmp_path):
+    cache = SemanticCache(StubEmbedder())
+    compute, _ = counting_compute()
+    run(cache.get_or_compute("prompt", compute, bucket="finance"))
+    cache.save(str(tmp_path))
+
+    restored = SemanticCache(StubEmbedder())
+    restored.load(str(tmp_path))
+    compute, calls = counting_compute()
+    run(restored.get_or_compute("prompt", compute, bucket="finance"))
+    assert not calls
+    run(restored.get_or_compute("prompt", compute, bucket="healthcare"))
+    assert calls == ["prompt"]
@@ -0,0 +1,25 @@
+import pytest
+
+from rag_pipeline import cpu
+
+
+@pytest.mark.parametrize("flags, target", [
+    ("fpu sse2 avx2 fma", "avx2"),
+    ("fpu avx2 avx512f avx512bw", "avx512"),
+    ("fpu avx2 avx512f avx512_vnni", "avx512_vnni"),
+])
+def test_int8_target_follows_the_cpu_flags(monkeypatch, tmp_path, flags, target):
+    monkeypatch.setattr(cpu.platform, "machine", lambda: "x86_64")
+    cpuinfo = tmp_path / "cpuinfo"
+    cpuinfo.write_text(f"processor\t: 0\nflags\t\t: {flags}\n")
+    assert cpu.int8_cpu_target.__wrapped__(str(cpuinfo)) == target
+
+
+def test_int8_target_on_arm_ignores_cpuinfo(monkeypatch, tmp_path):
+    monkeypatch.setattr(cpu.platform, "machine", lambda: "aarch64")
+    assert cpu.int8_cpu_target.__wrapped__(str(tmp_path / "missing")) == "arm64"
+
+
+def test_unreadable_cpuinfo_falls_back_to_avx2(monkeypatch, tmp_path):
+    monkeypatch.setattr(cpu.platform, "machine", lambda: "x86_64")
+    assert cpu.int8_cpu_target.__wrapped__(str(tmp_path / "missing")) == "avx2"
@@ -0,0 +1,34 @@
+import importlib
+
+import pytest
+
+from rag_pipeline import cpu, embedder
+
+
+@pytest.fixture
+def torch_backend(monkeypatch):
+    monkeypatch.setenv("EMBEDDER_BACKEND", "torch")
+    monkeypatch.delenv("EMBEDDER_ONNX_FILE", raising=False)
+
+    def fail(*args):
+        raise AssertionError("the CPU was probed")
+
+    monkeypatch.setattr(cpu, "int8_cpu_target", fail)
+    yield
+    monkeypatch.undo()
+    importlib.reload(embedder)
+
+
+def test_torch_backend_never_probes_the_cpu(torch_backend):
+    module = importlib.reload(embedder)
+    assert module.embedder_id() == module.EMBEDDING_MODEL_NAME
+
+
+def test_onnx_backend_picks_the_export_for_this_cpu(monkeypatch):
+    monkeypatch.setattr(embedder, "EMBEDDER_BACKEND", "onnx-int8")
+    monkeypatch.setattr(embedder, "ONNX_INT8_MODEL_FILE", None)
+    monkeypatch.setattr(embedder, "int8_cpu_target", lambda: "avx2")
+    assert embedder.embedder_id() == f"{embedder.EMBEDDING_MODEL_NAME}:onnx/model_quint8_avx2.onnx"
+
+    monkeypatch.setattr(embedder, "ONNX_INT8_MODEL_FILE", "onnx/custom.onnx")
+    assert embedder.embedder_id() == f"{embedder.EMBEDDING_MODEL_NAME}:onnx/custom.onnx"
@@ -0,0 +1,166 @@
+import numpy as np
+import pytest
+
+from rag_pipeline import index as index_module
+from rag_pipeline.index import HNSW_FINGERPRINT_FILE, HNSW_INDEX_FILE, VectorIndex
+
+
+class StubCollection:
+    """The slice of a Chroma collection VectorIndex reads: count() and paged get()."""
+
+    def __init__(self, embeddings, ids=None, id="collection"):
+        self.embeddings = np.asarray(embeddings, dtype=np.float32)
+        self.ids = ids or [f"id-{i}" for i in range(len(self.embeddings))]
+        self.id = id
+        self.pages = []
+
+    def count(self):
+        return len(self.embeddings)
+
+    def get(self, include, limit, offset):
+        self.pages.append((offset, limit))
+        rows = range(offset, min(offset + limit, len(self.embeddings)))
+        return {
+            "ids": self.ids[offset:offset + limit],
+            "embeddings": self.embeddings[offset:offset + limit],
+            "documents": [f"doc {i}" for i in rows],
+            "metadatas": [{"row": i} for i in rows],
+        }
+
+
+class StubStore:
+    def __init__(self, embeddings, **kwargs):
+        self._collection = StubCollection(embeddings, **kwargs)
+
+
+def corpus(n, dim=32, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+
+def rows(docs):
+    return [doc.metadata["row"] for doc in docs]
+
+
+def brute_force(embeddings, queries, k):
+    unit = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    q = np.atleast_2d(queries)
+    sims = (unit @ (q / np.linalg.norm(q, axis=1, keepdims=True)).T).max(axis=1)
+    return list(np.argsort(-sims)[:k])
+
+
+def test_empty_store_builds_no_index():
+    assert VectorIndex.from_chroma(StubStore(np.empty((0, 8)))) is None
+
+
+def test_collection_is_loaded_page_by_page_in_order(monkeypatch):
+    monkeypatch.setattr(index_module, "LOAD_PAGE_ROWS", 7)
+    embeddings = corpus(30)
+    store = StubStore(embeddings)
+
+    index = VectorIndex.from_chroma(store)
+
+    assert store._collection.pages == [(0, 7), (7, 7), (14, 7), (21, 7), (28, 2)]
+    assert [doc.page_content for doc in index.documents] == [f"doc {i}" for i in range(30)]
+    assert np.allclose(index.matrix, embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True), atol=1e-6)
+
+
+def test_exact_search_matches_brute_force():
+    embeddings = corpus(200)
+    index = VectorIndex.from_chroma(StubStore(embeddings))
+    query = np.random.default_rng(1).normal(size=32)
+
+    assert index.scales is None and index.index is None
+    assert rows(index.search(query, k=5)) == brute_force(embeddings, query, 5)
+
+
+@pytest.mark.parametrize("use_simsimd", [True, False])
+def test_int8_search_finds_the_same_neighbours(monkeypatch, use_simsimd):
+    if use_simsimd and index_module.simsimd is None:
+        pytest.skip("simsimd not installed")
+    if not use_simsimd:
+        monkeypatch.setattr(index_module, "simsimd", None)
+    embeddings = corpus(200)
+    index = VectorIndex.from_chroma(StubStore(embeddings), quantize=True)
+    assert index.matrix.dtype == np.int8
+
+    rng = np.random.default_rng(2)
+    for target in (3, 57, 199):
+        query = embeddings[target] + 0.01 * rng.normal(size=32)
+        assert rows(index.search(query, k=1)) == [target]
+
+
+def test_numpy_int8_scores_are_comparable_across_queries(monkeypatch):
+    monkeypatch.setattr(index_module, "simsimd", None)
+    embeddings = corpus(200)
+    index = VectorIndex.from_chroma(StubStore(embeddings), quantize=True)
+    # Very different query norms must not let one query's matches crowd out the other's
+    queries = np.stack([embeddings[10] * 100.0, embeddings[20] * 0.01])
+
+    assert set(rows(index.search_many(queries, k=2))) == {10, 20}
+
+
+def test_search_many_returns_each_document_once_best_first():
+    embeddings = corpus(100)
+    index = VectorIndex.from_chroma(StubStore(embeddings))
+    queries = np.stack([embeddings[5], embeddings[5] * 2.0, embeddings[40]])
+
+    found = rows(index.search_many(queries, k=4))
+    assert len(found) == len(set(found)) == 4
+    assert found == brute_force(embeddings, queries, 4)
+
+
+def test_k_is_capped_at_the_corpus_size():
+    index = VectorIndex.from_chroma(StubStore(corpus(3)))
+    assert len(index.search(np.ones(32), k=10)) == 3
+
+
+def test_large_store_uses_hnsw_and_persists_it(monkeypatch, tmp_path):
+    monkeypatch.setattr(index_module, "BRUTE_FORCE_MAX_VECTORS", 50)
+    embeddings = corpus(300)
+
+    index = VectorIndex.from_chroma(StubStore(embeddings), persist_dir=str(tmp_path))
+    assert index.matrix is None and index.index is not None
+    assert (tmp_path / HNSW_INDEX_FILE).exists() and (tmp_path / HNSW_FINGERPRINT_FILE).exists()
+    for target in (0, 150, 299):
+        assert rows(index.search(embeddings[target], k=1)) == [target]
+    queries = np.stack([embeddings[7], embeddings[7], embeddings[8]])
+    assert rows(index.search_many(queries, k=2)) in ([7, 8], [8, 7])
+
+    reloaded = VectorIndex.from_chroma(StubStore(embeddings), persist_dir=str(tmp_path))
+    assert reloaded.index.get_current_count() == 300
+    assert rows(reloaded.search(embeddings[42], k=1)) == [42]
+
+
+def test_stale_persisted_hnsw_index_is_rebuilt(monkeypatch, tmp_path):
+    monkeypatch.setattr(index_module, "BRUTE_FORCE_MAX_VECTORS", 50)
+    VectorIndex.from_chroma(StubStore(corpus(100)), persist_dir=str(tmp_path))
+
+    grown = corpus(150, seed=3)
+    index = VectorIndex.from_chroma(StubStore(grown), persist_dir=str(tmp_path))
+    assert index.index.get_current_count() == 150
+    assert rows(index.search(grown[120], k=1)) == [120]
+
+
+@pytest.mark.parametrize("change", [
+    {"ids": [f"new-{i}" for i in range(100)]},
+    {"id": "another collection"},
+])
+def test_same_size_reingested_collection_rebuilds_the_hnsw_index(monkeypatch, tmp_path, change):
+    monkeypatch.setattr(index_module, "BRUTE_FORCE_MAX_VECTORS", 50)
+    VectorIndex.from_chroma(StubStore(corpus(100)), persist_dir=str(tmp_path))
+
+    # Same number of rows, different vectors: the old graph's labels would point at the wrong documents
+    reingested = corpus(100, seed=4)
+    index = VectorIndex.from_chroma(StubStore(reingested, **change), persist_dir=str(tmp_path))
+    assert rows(index.search(reingested[60], k=1)) == [60]
+
+
+def test_hnsw_index_from_another_embedder_is_rebuilt(monkeypatch, tmp_path):
+    monkeypatch.setattr(index_module, "BRUTE_FORCE_MAX_VECTORS", 50)
+    VectorIndex.from_chroma(StubStore(corpus(100)), persist_dir=str(tmp_path), embedder_id="model-a")
+    fingerprint = (tmp_path / HNSW_FINGERPRINT_FILE).read_text()
+
+    reembedded = corpus(100, seed=5)
+    index = VectorIndex.from_chroma(StubStore(reembedded), persist_dir=str(tmp_path), embedder_id="model-b")
+    assert (tmp_path / HNSW_FINGERPRINT_FILE).read_text() != fingerprint
+    assert rows(index.search(reembedded[30], k=1)) == [30]
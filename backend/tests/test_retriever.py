@@ -0,0 +1,38 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from rag_pipeline import retriever
+
+
+def test_llm_pipeline_returns_only_the_generated_text(monkeypatch):
+    calls = []
+    monkeypatch.setattr(retriever, "load_llm_tokenizer", lambda: "tokenizer")
+    monkeypatch.setattr(retriever, "load_llm_model", lambda: ("model", -1))
+    monkeypatch.setattr(retriever, "pipeline", lambda task, **kwargs: calls.append(kwargs) or "pipe")
+    monkeypatch.setattr(retriever, "HuggingFacePipeline", lambda pipeline, batch_size: (pipeline, batch_size))
+
+    assert retriever.load_llm() == ("pipe", retriever.LLM_GENERATION_BATCH_SIZE)
+    assert calls[0]["return_full_text"] is False
+
+
+def test_agenerate_answers_sends_the_prompts_unchanged_in_one_call():
+    calls = []
+
+    class StubLLM:
+        async def agenerate(self, prompts):
+            calls.append(prompts)
+            return SimpleNamespace(generations=[[SimpleNamespace(text=f"answer {i}")] for i in range(len(prompts))])
+
+    prompts = ["first advice prompt", "second advice prompt"]
+    assert asyncio.run(retriever.agenerate_answers(StubLLM(), prompts)) == ["answer 0", "answer 1"]
+    assert calls == [prompts]
+
+
+@pytest.mark.parametrize("target, reduce_range", [("avx2", True), ("avx512", True), ("avx512_vnni", False), ("arm64", False)])
+def test_llm_quantization_config_matches_the_cpu(target, reduce_range):
+    pytest.importorskip("optimum.onnxruntime")
+    config = retriever._int8_quantization_config(target)
+    assert config.is_static is False
+    assert config.reduce_range is reduce_range
@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.documents import Document
+
+from rag_pipeline import store
+
+# Chunks lazy_chunks has yielded so far
+reads = [0]
+
+
+class StubChroma:
+    """Records each add_documents batch, and how many chunks had been read when it arrived."""
+
+    max_batch_size = None
+
+    def __init__(self, embedding_function, **location):
+        self.embedding_function = embedding_function
+        self.location = location
+        self.batches = []
+        self.read_at_add = []
+        self._client = SimpleNamespace()
+        if self.max_batch_size is not None:
+            self._client.get_max_batch_size = lambda: self.max_batch_size
+
+    def add_documents(self, batch):
+        self.batches.append([doc.page_content for doc in batch])
+        self.read_at_add.append(reads[0])
+
+
+def lazy_chunks(n):
+    for i in range(n):
+        reads[0] += 1
+        yield Document(page_content=f"chunk {i}")
+
+
+@pytest.fixture(autouse=True)
+def stub_chroma(monkeypatch):
+    reads[0] = 0
+    monkeypatch.setattr(store, "Chroma", StubChroma)
+    monkeypatch.setattr(store, "CHROMA_HOST", None)
+    monkeypatch.setattr(store, "_http_client", None)
+    monkeypatch.setattr(StubChroma, "max_batch_size", None)
+
+
+def test_chunks_are_written_in_ingest_batches_as_they_are_read(monkeypatch, tmp_path):
+    monkeypatch.setattr(store, "INGEST_BATCH_SIZE", 4)
+
+    db = store.store_embeddings(lazy_chunks(10), "embedder", persist_dir=str(tmp_path))
+
+    assert db.batches == [[f"chunk {i}" for i in range(start, min(start + 4, 10))] for start in (0, 4, 8)]
+    # Each batch goes out as soon as it is full, so at most one batch is held in memory
+    assert db.read_at_add == [4, 8, 10]
+    assert db.location["persist_directory"] == str(tmp_path)
+
+
+def test_batches_are_capped_at_the_clients_max_batch_size(monkeypatch, tmp_path):
+    monkeypatch.setattr(store, "INGEST_BATCH_SIZE", 4096)
+    monkeypatch.setattr(StubChroma, "max_batch_size", 3)
+
+    db = store.store_embeddings(lazy_chunks(7), "embedder", persist_dir=str(tmp_path))
+    assert [len(batch) for batch in db.batches] == [3, 3, 1]
+
+
+def test_an_empty_corpus_writes_nothing(tmp_path):
+    assert store.store_embeddings(iter([]), "embedder", persist_dir=str(tmp_path)).batches == []